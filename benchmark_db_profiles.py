@@ -0,0 +1,87 @@
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+from database import PERFORMANCE_PROFILES, Database, close_all_pools
+
+
+def benchmark_profile(profile, rows, threads):
+    db_dir = tempfile.mkdtemp(prefix=f"payroll-bench-{profile}-")
+    try:
+        db = Database(db_dir, profile=profile)
+        insert = '''
+                 INSERT INTO salaries (employee_id, base_salary, allowances, deductions,
+                                       effective_date)
+                 VALUES (?, ?, ?, ?, ?) \
+                 '''
+
+        start = time.perf_counter()
+        for i in range(rows):
+            db.execute_update("salary", insert,
+                              (f"E{i:07d}", 50000.0 + i, 500.0, 200.0, '2024-01-01'))
+        write_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(rows):
+            db.execute_single("salary", "SELECT * FROM salaries WHERE id = ?", (i + 1,))
+        read_elapsed = time.perf_counter() - start
+
+        per_thread = max(rows // threads, 1)
+        errors = []
+
+        def mixed_worker(n):
+            try:
+                for i in range(per_thread):
+                    db.execute_update("salary", insert,
+                                      (f"T{n}-{i}", 40000.0, 0.0, 0.0, '2024-02-01'))
+                    db.execute_single("salary", "SELECT COUNT(*) FROM salaries")
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=mixed_worker, args=(n,))
+                   for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        mixed_elapsed = time.perf_counter() - start
+
+        return {
+            'writes_per_sec': rows / write_elapsed,
+            'reads_per_sec': rows / read_elapsed,
+            'mixed_ops_per_sec': (per_thread * threads * 2) / mixed_elapsed,
+            'errors': len(errors)
+        }
+    finally:
+        close_all_pools()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite performance profiles")
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--profiles', nargs='+', default=list(PERFORMANCE_PROFILES))
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"SQLITE PROFILE BENCHMARK ({args.rows} rows, {args.threads} threads)")
+    print("=" * 70)
+    print(f"{'Profile':<10} {'Writes/s':>12} {'Reads/s':>12} "
+          f"{'Mixed ops/s':>14} {'Errors':>8}")
+    print("-" * 70)
+
+    for profile in args.profiles:
+        result = benchmark_profile(profile, args.rows, args.threads)
+        print(f"{profile:<10} {result['writes_per_sec']:>12,.0f} "
+              f"{result['reads_per_sec']:>12,.0f} "
+              f"{result['mixed_ops_per_sec']:>14,.0f} {result['errors']:>8}")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
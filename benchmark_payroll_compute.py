@@ -0,0 +1,62 @@
+import argparse
+import random
+import time
+
+import payroll_engine
+from payroll_engine import compute_payroll_rows
+
+
+def make_rows(count, seed=42):
+    rng = random.Random(seed)
+    return [(f"EMP{i:07d}",
+             round(rng.uniform(2000, 15000), 2),
+             round(rng.uniform(0, 1500), 2),
+             round(rng.uniform(0, 800), 2))
+            for i in range(count)]
+
+
+def benchmark(rows, vectorized, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = compute_payroll_rows(rows, vectorized=vectorized)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the pure-Python and NumPy net salary computation")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+
+    print("=" * 70)
+    print(f"NET SALARY COMPUTATION BENCHMARK ({args.rows} rows, best of {args.repeat})")
+    print("=" * 70)
+    print(f"{'Path':<14} {'Seconds':>10} {'Rows/s':>14}")
+    print("-" * 70)
+
+    python_elapsed, python_rows = benchmark(rows, False, args.repeat)
+    print(f"{'pure Python':<14} {python_elapsed:>10.3f} "
+          f"{args.rows / python_elapsed:>14,.0f}")
+
+    if payroll_engine.np is None:
+        print(f"{'numpy':<14} {'skipped: numpy is not installed':>25}")
+    else:
+        numpy_elapsed, numpy_rows = benchmark(rows, True, args.repeat)
+        print(f"{'numpy':<14} {numpy_elapsed:>10.3f} "
+              f"{args.rows / numpy_elapsed:>14,.0f}")
+        print("-" * 70)
+        print(f"Speedup: {python_elapsed / numpy_elapsed:.1f}x, "
+              f"results identical: {numpy_rows == python_rows}")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,243 @@
 import sqlite3
 import os
 import shutil
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from migrations import migrate
+from query_stats import query_stats
+
+POOL_MAX_SIZE = int(os.environ.get('PAYROLL_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 30.0
+POOL_HEALTH_CHECK_INTERVAL = 60.0
+
+PERFORMANCE_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 10000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+}
+DEFAULT_PROFILE = 'balanced'
+
+
+def get_profile_name(profile=None):
+    name = profile or os.environ.get('PAYROLL_DB_PROFILE') or DEFAULT_PROFILE
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown database profile '{name}'. "
+                         f"Choose from: {', '.join(PERFORMANCE_PROFILES)}")
+    return name
+
+
+def apply_profile(conn, profile, read_only=False):
+    settings = PERFORMANCE_PROFILES[profile]
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+    if read_only:
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections to a single database file."""
+
+    def __init__(self, connect, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise PoolTimeoutError(
+                        "timed out waiting for a database connection")
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+
+        if conn is not None and not self._is_healthy(conn, last_used):
+            self._close_quietly(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                self._discard()
+                raise
+        return conn
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                broken = True
+
+        if broken:
+            self._close_quietly(conn)
+            self._discard()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+    from result_cache import result_cache
+    result_cache.clear()
+
+
+DATABASES = ('admin', 'employees', 'salary', 'payroll')
+
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def is_serverless():
+    return bool(os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+
+def is_read_query(query):
+    return query.lstrip()[:6].upper() == 'SELECT'
 
 
 class Database:
-    def __init__(self):
-        if os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    def __init__(self, db_dir=None, profile=None, read_only=False):
+        self.profile = get_profile_name(profile)
+        self.read_only = read_only
+        if db_dir is not None:
+            self.db_dir = db_dir
+        elif is_serverless():
             self.db_dir = "/tmp/databases"
-            self.ensure_database_directory()
-            package_db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "databases")
-            if os.path.exists(package_db_dir):
-                for f in os.listdir(package_db_dir):
-                    src = os.path.join(package_db_dir, f)
-                    dst = os.path.join(self.db_dir, f)
-                    if os.path.isfile(src) and not os.path.exists(dst):
-                        try:
-                            shutil.copy2(src, dst)
-                        except Exception:
-                            pass
         else:
             self.db_dir = "databases"
+        self.bootstrap()
+
+    def bootstrap(self):
+        key = os.path.abspath(self.db_dir)
+        if key in _bootstrapped:
+            return
+        with _bootstrap_lock:
+            if key in _bootstrapped:
+                return
             self.ensure_database_directory()
-        self.init_databases()
+            if is_serverless():
+                self.copy_packaged_databases()
+            self.init_databases()
+            _bootstrapped.add(key)
 
     def ensure_database_directory(self):
         if not os.path.exists(self.db_dir):
             os.makedirs(self.db_dir)
 
+    def copy_packaged_databases(self):
+        package_db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      "databases")
+        if not os.path.exists(package_db_dir):
+            return
+        for f in os.listdir(package_db_dir):
+            src = os.path.join(package_db_dir, f)
+            dst = os.path.join(self.db_dir, f)
+            if os.path.isfile(src) and not os.path.exists(dst):
+                try:
+                    shutil.copy2(src, dst)
+                except Exception:
+                    pass
+
     def init_databases(self):
-        self.init_admin_db()
-        self.init_employee_db()
-        self.init_salary_db()
-        self.init_payroll_db()
+        for db_name, init in (("admin", self.init_admin_db),
+                              ("employees", self.init_employee_db),
+                              ("salary", self.init_salary_db),
+                              ("payroll", self.init_payroll_db)):
+            conn = self.get_connection(db_name)
+            try:
+                migrate(conn, db_name, init)
+            finally:
+                conn.close()
 
-    def init_admin_db(self):
-        conn = sqlite3.connect(f"{self.db_dir}/admin.db")
+    def init_admin_db(self, conn):
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -68,11 +271,7 @@ class Database:
             cursor.execute("INSERT INTO admins (username, password) VALUES (?, ?)",
                            ('admin', 'admin123'))
 
-        conn.commit()
-        conn.close()
-
-    def init_employee_db(self):
-        conn = sqlite3.connect(f"{self.db_dir}/employees.db")
+    def init_employee_db(self, conn):
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -126,11 +325,7 @@ class Database:
                        )
                        ''')
 
-        conn.commit()
-        conn.close()
-
-    def init_salary_db(self):
-        conn = sqlite3.connect(f"{self.db_dir}/salary.db")
+    def init_salary_db(self, conn):
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -176,11 +371,7 @@ class Database:
                            )
                        ''')
 
-        conn.commit()
-        conn.close()
-
-    def init_payroll_db(self):
-        conn = sqlite3.connect(f"{self.db_dir}/payroll.db")
+    def init_payroll_db(self, conn):
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -230,34 +421,208 @@ class Database:
                        )
                        ''')
 
-        conn.commit()
-        conn.close()
+    def _database_uri(self, db_name, read_only):
+        path = quote(os.path.abspath(f"{self.db_dir}/{db_name}.db"))
+        return f"file:{path}?mode=ro" if read_only else f"file:{path}"
 
-    def get_connection(self, db_name):
-        return sqlite3.connect(f"{self.db_dir}/{db_name}.db")
+    def get_connection(self, db_name, attach=(), read_only=False):
+        busy_timeout = PERFORMANCE_PROFILES[self.profile]['busy_timeout']
+        conn = sqlite3.connect(self._database_uri(db_name, read_only), uri=True,
+                               timeout=busy_timeout / 1000, check_same_thread=False)
+        apply_profile(conn, self.profile, read_only)
+        for name in attach:
+            if name not in DATABASES or name == db_name:
+                conn.close()
+                raise ValueError(f"Cannot attach database '{name}' to '{db_name}'")
+            conn.execute(f"ATTACH DATABASE ? AS {name}",
+                         (self._database_uri(name, read_only),))
+        return conn
 
-    def execute_query(self, db_name, query, params=()):
-        conn = self.get_connection(db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        result = cursor.fetchall()
-        conn.close()
+    def _db_key(self, db_name):
+        return os.path.abspath(f"{self.db_dir}/{db_name}.db"), self.profile
+
+    def get_pool(self, db_name, attach=(), read_only=False):
+        attach = tuple(sorted(attach))
+        key = self._db_key(db_name) + (attach, read_only)
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        lambda: self.get_connection(db_name, attach, read_only))
+                    _pools[key] = pool
+        return pool
+
+    def _active_transactions(self):
+        if not hasattr(_local, 'transactions'):
+            _local.transactions = {}
+        return _local.transactions
+
+    def _transaction_connection(self, db_name, attach):
+        key = self._db_key(db_name) + (self.read_only,)
+        active = self._active_transactions().get(key)
+        if active is None:
+            return None
+        conn, attached = active
+        if not set(attach) <= set(attached):
+            raise ValueError(f"Transaction on '{db_name}' was opened without attaching "
+                             f"{', '.join(sorted(set(attach) - set(attached)))}")
+        return conn
+
+    def get_query_stats(self):
+        return query_stats.snapshot()
+
+    @contextmanager
+    def transaction(self, db_name, attach=()):
+        key = self._db_key(db_name) + (self.read_only,)
+        active = self._active_transactions()
+        if key in active:
+            yield self._transaction_connection(db_name, attach)
+            return
+
+        pool = self.get_pool(db_name, attach, self.read_only)
+        conn = pool.acquire()
+        active[key] = (conn, tuple(attach))
+        broken = False
+        try:
+            # IMMEDIATE would also take write locks on every attached database.
+            conn.execute("BEGIN" if attach or self.read_only else "BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                broken = True
+            broken = broken or (isinstance(e, sqlite3.DatabaseError) and
+                                not isinstance(e, (sqlite3.IntegrityError,
+                                                   sqlite3.OperationalError)))
+            raise
+        finally:
+            del active[key]
+            pool.release(conn, broken=broken)
+
+    def _run(self, db_name, handler, attach=(), commit=False, query=None, params=(),
+             read_only=False):
+        conn = self._transaction_connection(db_name, attach)
+        if conn is not None:
+            return self._timed(conn, db_name, handler, query, params)
+
+        pool = self.get_pool(db_name, attach, read_only or self.read_only)
+        conn = pool.acquire()
+        try:
+            result = self._timed(conn, db_name, handler, query, params)
+            if commit:
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            pool.release(conn, broken=not isinstance(e, (sqlite3.IntegrityError,
+                                                         sqlite3.OperationalError)))
+            raise
+        except BaseException:
+            pool.release(conn)
+            raise
+        pool.release(conn)
         return result
 
-    def execute_update(self, db_name, query, params=()):
-        conn = self.get_connection(db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        last_id = cursor.lastrowid
-        conn.close()
-        return last_id
-
-    def execute_single(self, db_name, query, params=()):
-        conn = self.get_connection(db_name)
+    def _timed(self, conn, db_name, handler, query, params):
+        if not query_stats.enabled or query is None:
+            return handler(conn)
+
+        start = time.perf_counter()
+        result = handler(conn)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if isinstance(result, list):
+            rows = len(result)
+        elif result is None or isinstance(result, int):
+            rows = 0
+        else:
+            rows = 1
+        query_stats.record(db_name, query, elapsed_ms, rows)
+        if query_stats.is_slow(elapsed_ms):
+            query_stats.log_slow_query(db_name, query, params, elapsed_ms, conn)
+        return result
+
+    def execute_query(self, db_name, query, params=(), attach=(), row_factory=None):
+        def handler(conn):
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        read_only = is_read_query(query)
+        return self._run(db_name, handler, attach, commit=not read_only, query=query,
+                         params=params, read_only=read_only)
+
+    def iter_query(self, db_name, query, params=(), attach=(), row_factory=None,
+                   batch_size=500):
+        # Yields rows as the cursor reads them, batch_size at a time. The pooled
+        # connection is held until the generator is exhausted or closed.
+        conn = self._transaction_connection(db_name, attach)
+        pool = None
+        if conn is None:
+            pool = self.get_pool(db_name, attach,
+                                 self.read_only or is_read_query(query))
+            conn = pool.acquire()
+
+        broken = False
         cursor = conn.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        conn.close()
-        return result
\ No newline at end of file
+        cursor.row_factory = row_factory
+        elapsed = 0.0
+        rows = 0
+        try:
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            elapsed += time.perf_counter() - start
+            while True:
+                start = time.perf_counter()
+                batch = cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not batch:
+                    break
+                rows += len(batch)
+                yield from batch
+        except sqlite3.DatabaseError as e:
+            broken = not isinstance(e, (sqlite3.IntegrityError,
+                                        sqlite3.OperationalError))
+            raise
+        finally:
+            cursor.close()
+            if pool is not None:
+                pool.release(conn, broken=broken)
+            if query_stats.enabled:
+                query_stats.record(db_name, query, elapsed * 1000, rows)
+
+    def execute_update(self, db_name, query, params=(), attach=()):
+        def handler(conn):
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.lastrowid
+        return self._run(db_name, handler, attach, commit=True, query=query,
+                         params=params)
+
+    def execute_rowcount(self, db_name, query, params=(), attach=()):
+        def handler(conn):
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.rowcount
+        return self._run(db_name, handler, attach, commit=True, query=query,
+                         params=params)
+
+    def execute_many(self, db_name, query, rows, attach=()):
+        def handler(conn):
+            cursor = conn.cursor()
+            cursor.executemany(query, rows)
+            return cursor.rowcount
+        first_row = rows[0] if isinstance(rows, list) and rows else ()
+        return self._run(db_name, handler, attach, commit=True, query=query,
+                         params=first_row)
+
+    def execute_single(self, db_name, query, params=(), attach=(), row_factory=None):
+        def handler(conn):
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        return self._run(db_name, handler, attach, query=query, params=params,
+                         read_only=is_read_query(query))
@@ -1,6 +1,10 @@
+import sqlite3
 import uuid
 from datetime import datetime
 
+from models import Employee
+from pagination import fetch_page
+
 
 class EmployeeManager:
     def __init__(self, db):
@@ -31,50 +35,39 @@ class EmployeeManager:
         except Exception:
             pass
 
-    def get_all_employees(self):
-        query = "SELECT * FROM employees ORDER BY last_name, first_name"
-        results = self.db.execute_query("employees", query)
-
-        employees = []
-        for row in results:
-            employees.append({
-                'id': row[0],
-                'employee_id': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'email': row[4],
-                'phone': row[5],
-                'department': row[6],
-                'position': row[7],
-                'hire_date': row[8],
-                'status': row[9],
-                'created_at': row[10]
-            })
-        return employees
-
-    def get_employee_by_id(self, employee_id):
-        query = "SELECT * FROM employees WHERE employee_id = ?"
-        result = self.db.execute_single("employees", query, (employee_id,))
-
-        if result:
-            return {
-                'id': result[0],
-                'employee_id': result[1],
-                'first_name': result[2],
-                'last_name': result[3],
-                'email': result[4],
-                'phone': result[5],
-                'department': result[6],
-                'position': result[7],
-                'hire_date': result[8],
-                'status': result[9],
-                'created_at': result[10]
-            }
-        return None
-
-    def search_employee(self, search_term):
+    def add_employees(self, employees):
+        """All-or-nothing insert; returns 0 if a row breaks a constraint."""
         query = '''
-                SELECT * \
+                INSERT INTO employees (employee_id, first_name, last_name, email, phone,
+                                       department, position, hire_date, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) \
+                '''
+        rows = [(
+            str(uuid.uuid4())[:8],
+            employee_data['first_name'],
+            employee_data['last_name'],
+            employee_data['email'],
+            employee_data['phone'],
+            employee_data['department'],
+            employee_data['position'],
+            employee_data['hire_date'],
+            employee_data['status']
+        ) for employee_data in employees]
+
+        try:
+            with self.db.transaction("employees"):
+                return self.db.execute_many("employees", query, rows)
+        except sqlite3.IntegrityError:
+            return 0
+
+    def _employees_query(self, search_term=None):
+        if not search_term:
+            query = (f"SELECT {Employee.columns()} FROM employees "
+                     "ORDER BY last_name, first_name")
+            return query, ()
+
+        query = f'''
+                SELECT {Employee.columns()}
                 FROM employees
                 WHERE employee_id LIKE ? \
                    OR first_name LIKE ? \
@@ -84,26 +77,52 @@ class EmployeeManager:
                    OR position LIKE ? \
                 '''
         search_pattern = f"%{search_term}%"
-        results = self.db.execute_query("employees", query,
-                                        (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern,
-                                         search_pattern))
-
-        employees = []
-        for row in results:
-            employees.append({
-                'id': row[0],
-                'employee_id': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'email': row[4],
-                'phone': row[5],
-                'department': row[6],
-                'position': row[7],
-                'hire_date': row[8],
-                'status': row[9],
-                'created_at': row[10]
-            })
-        return employees
+        return query, (search_pattern,) * 6
+
+    def get_all_employees(self):
+        query, params = self._employees_query()
+        return self.db.execute_query("employees", query, params,
+                                     row_factory=Employee.row_factory)
+
+    EMPLOYEE_SORTS = {
+        'name': (('last_name', 'last_name'), ('first_name', 'first_name'),
+                 ('employee_id', 'employee_id')),
+        'department': (('department', 'department'), ('last_name', 'last_name'),
+                       ('first_name', 'first_name'), ('employee_id', 'employee_id')),
+        'hire_date': (('hire_date', 'hire_date'), ('employee_id', 'employee_id')),
+        'employee_id': (('employee_id', 'employee_id'),)
+    }
+
+    def list_employees(self, limit=None, cursor=None, sort='name', order='asc',
+                       department=None, status=None, hired_from=None, hired_to=None):
+        conditions = []
+        params = []
+        for condition, value in (("department = ?", department),
+                                 ("status = ?", status),
+                                 ("hire_date >= ?", hired_from),
+                                 ("hire_date <= ?", hired_to)):
+            if value:
+                conditions.append(condition)
+                params.append(value)
+        select = f"SELECT {Employee.columns()} FROM employees"
+        return fetch_page(self.db, "employees", select, conditions, params,
+                          self.EMPLOYEE_SORTS, sort, order, limit, cursor,
+                          row_factory=Employee.row_factory)
+
+    def get_employee_by_id(self, employee_id):
+        query = f"SELECT {Employee.columns()} FROM employees WHERE employee_id = ?"
+        return self.db.execute_single("employees", query, (employee_id,),
+                                      row_factory=Employee.row_factory)
+
+    def search_employee(self, search_term):
+        query, params = self._employees_query(search_term)
+        return self.db.execute_query("employees", query, params,
+                                     row_factory=Employee.row_factory)
+
+    def iter_employees(self, search_term=None):
+        query, params = self._employees_query(search_term)
+        return self.db.iter_query("employees", query, params,
+                                  row_factory=Employee.row_factory)
 
     def update_employee(self, employee_id, updates):
         set_clauses = []
@@ -128,31 +147,23 @@ class EmployeeManager:
     def delete_employee(self, employee_id):
         query = "DELETE FROM employees WHERE employee_id = ?"
         try:
-            self.db.execute_update("employees", query, (employee_id,))
+            with self.db.transaction("employees", attach=("payroll",)):
+                self.db.execute_update("employees", query, (employee_id,))
+                # Clearing the department snapshot moves the employee's records
+                # out of the department aggregates, as the reports drop them.
+                self.db.execute_update("employees", "UPDATE payroll.payroll_records "
+                                                    "SET department = NULL "
+                                                    "WHERE employee_id = ?",
+                                       (employee_id,))
             return True
         except:
             return False
 
     def get_employees_by_department(self, department):
-        query = "SELECT * FROM employees WHERE department = ? ORDER BY last_name, first_name"
-        results = self.db.execute_query("employees", query, (department,))
-
-        employees = []
-        for row in results:
-            employees.append({
-                'id': row[0],
-                'employee_id': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'email': row[4],
-                'phone': row[5],
-                'department': row[6],
-                'position': row[7],
-                'hire_date': row[8],
-                'status': row[9],
-                'created_at': row[10]
-            })
-        return employees
+        query = (f"SELECT {Employee.columns()} FROM employees WHERE department = ? "
+                 "ORDER BY last_name, first_name")
+        return self.db.execute_query("employees", query, (department,),
+                                     row_factory=Employee.row_factory)
 
     def get_employee_count(self):
         query = "SELECT COUNT(*) FROM employees"
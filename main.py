@@ -118,10 +118,12 @@ class PayrollSystem:
             print("1. Set Employee Salary")
             print("2. View Salary History")
             print("3. Process Payroll")
-            print("4. Generate Payslip")
-            print("5. Back to Admin Menu")
+            print("4. Preview Payroll")
+            print("5. Generate Payslip")
+            print("6. Back to Admin Menu")
 
-            choice = get_valid_input("Enter your choice (1-5): ", ["1", "2", "3", "4", "5"])
+            choice = get_valid_input("Enter your choice (1-6): ",
+                                     ["1", "2", "3", "4", "5", "6"])
 
             if choice == "1":
                 self.set_employee_salary()
@@ -130,6 +132,8 @@ class PayrollSystem:
             elif choice == "3":
                 self.process_payroll()
             elif choice == "4":
+                self.preview_payroll()
+            elif choice == "5":
                 self.generate_payslip()
             else:
                 break
@@ -354,6 +358,46 @@ class PayrollSystem:
 
         input("Press Enter to continue...")
 
+    def preview_payroll(self):
+        clear_screen()
+        display_banner()
+        print("\n=== PREVIEW PAYROLL ===")
+
+        period = input("Enter payroll period (e.g., 2024-01): ").strip()
+
+        if not period:
+            period = datetime.now().strftime('%Y-%m')
+
+        print(create_separator('='))
+        print(f"PAYROLL PREVIEW - {period} (nothing is saved)")
+        print(create_separator('-'))
+        print(f"{'ID':<10} {'Name':<20} {'Department':<15} "
+              f"{'Base Salary':<12} {'Net Salary':<12}")
+        print(create_separator('-'))
+
+        try:
+            for item in self.salary_manager.preview_payroll(period):
+                if item['type'] == 'row':
+                    name = f"{item['first_name']} {item['last_name']}"
+                    print(f"{item['employee_id']:<10} {name:<20} "
+                          f"{item['department']:<15} "
+                          f"{format_currency(item['base_salary']):<12} "
+                          f"{format_currency(item['net_salary']):<12}")
+                    continue
+
+                print(create_separator('-'))
+                for dept in item['departments']:
+                    print(f"  {dept['department']}: "
+                          f"{dept['employee_count']} employees, "
+                          f"Total: {format_currency(dept['total_net_salary'])}")
+                print(f"Total Employees: {item['employee_count']}")
+                print(f"Total Payroll: {format_currency(item['total_net_salary'])}")
+                print(create_separator('='))
+        except ValueError:
+            print("Invalid period. Use the YYYY-MM format.")
+
+        input("Press Enter to continue...")
+
     def generate_payslip(self):
         clear_screen()
         display_banner()
@@ -536,12 +580,86 @@ class PayrollSystem:
 
         print("=" * 50)
 
+
 # Flask Web Application Setup
-from flask import Flask, render_template, request, jsonify, session
+from flask import (Flask, Response, render_template, request, jsonify,  # noqa: E402
+                   session, stream_with_context)
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from models import Record  # noqa: E402
+from payroll_jobs import payroll_jobs  # noqa: E402
+from query_stats import query_stats  # noqa: E402
+from result_cache import result_cache  # noqa: E402
+
+
+class PayrollJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = PayrollJSONProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "super-secret-payroll-key-13579")
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def requested_stream_format():
+    """'ndjson' or 'json-stream' when the client asked for a streamed response."""
+    fmt = request.args.get('format', '').strip().lower()
+    if fmt in ('ndjson', 'json-stream'):
+        return fmt
+    best = request.accept_mimetypes.best_match(['application/json',
+                                                'application/x-ndjson'])
+    if best == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+
+def paging_args(*filters):
+    """Keyword arguments for a keyset-paginated list call, or None for the full list."""
+    names = ('limit', 'cursor', 'sort', 'order') + filters
+    if not any(request.args.get(name, '').strip() for name in names):
+        return None
+    return {name: request.args[name].strip() for name in names
+            if request.args.get(name, '').strip()}
+
+
+def stream_json(rows, fmt, envelope=None, key='records'):
+    # ndjson writes one document per row. json-stream writes the same document as
+    # the buffered endpoint (a list, or envelope with the rows under key) while
+    # the rows are still being read.
+    def generate():
+        buffer = []
+        size = 0
+        if fmt == 'json-stream':
+            head = "[" if envelope is None else app.json.dumps(envelope)[:-1] + \
+                (", " if envelope else "") + f'"{key}": ['
+            buffer.append(head)
+
+        for index, row in enumerate(rows):
+            if fmt == 'ndjson':
+                chunk = app.json.dumps(row) + "\n"
+            else:
+                chunk = ("," if index else "") + app.json.dumps(row)
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+
+        if fmt == 'json-stream':
+            buffer.append("]" if envelope is None else "]}")
+        if buffer:
+            yield "".join(buffer)
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 
 @app.route('/')
 def index():
@@ -581,7 +699,7 @@ def api_stats():
     if 'admin_logged_in' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    db = Database()
+    db = Database(read_only=True)
     employee_manager = EmployeeManager(db)
     salary_manager = SalaryManager(db)
 
@@ -606,9 +724,20 @@ def api_employees():
         return jsonify({'error': 'Unauthorized'}), 401
 
     search_term = request.args.get('q', '').strip()
-    db = Database()
+    db = Database(read_only=True)
     employee_manager = EmployeeManager(db)
 
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_json(employee_manager.iter_employees(search_term), stream_format)
+
+    paging = paging_args('department', 'status', 'hired_from', 'hired_to')
+    if paging is not None and not search_term:
+        try:
+            return jsonify(employee_manager.list_employees(**paging))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
     if search_term:
         employees = employee_manager.search_employee(search_term)
     else:
@@ -685,6 +814,15 @@ def api_salary_history(employee_id):
 
     db = Database()
     salary_manager = SalaryManager(db)
+
+    paging = paging_args()
+    if paging is not None:
+        paging.pop('sort', None)
+        try:
+            return jsonify(salary_manager.list_salary_history(employee_id, **paging))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
     history = salary_manager.get_salary_history(employee_id)
     current = salary_manager.get_current_salary(employee_id)
 
@@ -738,13 +876,129 @@ def api_process_payroll():
     if not period:
         period = datetime.now().strftime('%Y-%m')
 
-    db = Database()
-    salary_manager = SalaryManager(db)
-    processed_count = salary_manager.process_payroll(period)
+    incremental = data.get('incremental', False)
+    if isinstance(incremental, str):
+        incremental = {'true': True, 'false': False}.get(incremental.strip().lower())
+    if incremental not in (True, False):
+        return jsonify({'error': 'incremental must be true or false'}), 400
+
+    job_id = payroll_jobs.submit(period, incremental=bool(incremental))
+    job = payroll_jobs.get(job_id)
+    if job['status'] in ('completed', 'failed'):
+        # Run in the request when serverless: there is nothing left to poll.
+        return jsonify({
+            'success': job['status'] == 'completed',
+            'job_id': job_id,
+            'job': job,
+            'message': f'Payroll run for {period} {job["status"]}'
+        }), 200 if job['status'] == 'completed' else 500
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'message': f'Payroll run for {period} queued'
+    }), 202
+
+
+@app.route('/api/payroll/preview', methods=['GET'])
+def api_payroll_preview():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    period = request.args.get('period', '').strip()
+    if not period:
+        period = datetime.now().strftime('%Y-%m')
+
+    try:
+        datetime.strptime(period, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'Period must use the YYYY-MM format'}), 400
+
+    salary_manager = SalaryManager(Database(read_only=True))
+    return stream_json(salary_manager.preview_payroll(period), 'ndjson')
+
+
+@app.route('/api/payroll/diff', methods=['GET'])
+def api_payroll_diff():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    previous_period = request.args.get('from', '').strip()
+    current_period = request.args.get('to', '').strip()
+    if not previous_period or not current_period:
+        return jsonify({'error': 'Both from and to periods are required'}), 400
+
+    # Periods are compared as text, so '2024-1' would silently match nothing.
+    for period in (previous_period, current_period):
+        try:
+            valid = datetime.strptime(period, '%Y-%m').strftime('%Y-%m') == period
+        except ValueError:
+            valid = False
+        if not valid:
+            return jsonify({'error': 'Periods must use the YYYY-MM format'}), 400
+
+    try:
+        threshold = float(request.args.get('threshold', 0))
+    except ValueError:
+        return jsonify({'error': 'Threshold must be a number'}), 400
+
+    salary_manager = SalaryManager(Database(read_only=True))
+    return jsonify(salary_manager.compare_periods(previous_period, current_period,
+                                                  threshold))
+
+
+@app.route('/api/analytics/trend', methods=['GET'])
+def api_analytics_trend():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    start_period = request.args.get('from', '').strip()
+    end_period = request.args.get('to', '').strip()
+    if not start_period or not end_period:
+        return jsonify({'error': 'Both from and to periods are required'}), 400
+    department = request.args.get('department', '').strip() or None
+
+    salary_manager = SalaryManager(Database(read_only=True))
+    try:
+        trend = salary_manager.get_payroll_trend(start_period, end_period, department)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'from': start_period, 'to': end_period, 'department': department,
+                    'periods': trend})
+
+
+@app.route('/api/analytics/distribution', methods=['GET'])
+def api_analytics_distribution():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    start_period = request.args.get('from', '').strip()
+    end_period = request.args.get('to', '').strip()
+    if not start_period or not end_period:
+        return jsonify({'error': 'Both from and to periods are required'}), 400
+    department = request.args.get('department', '').strip() or None
+    metric = request.args.get('metric', 'net_salary')
+
+    salary_manager = SalaryManager(Database(read_only=True))
+    try:
+        quantiles = salary_manager.DEFAULT_QUANTILES
+        if request.args.get('quantiles'):
+            quantiles = [float(q) for q in request.args['quantiles'].split(',')]
+        distribution = salary_manager.get_salary_distribution(
+            start_period, end_period, department, metric, quantiles)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(dict(distribution, **{'from': start_period, 'to': end_period}))
+
+
+@app.route('/api/payroll/jobs/<job_id>', methods=['GET'])
+def api_payroll_job(job_id):
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
 
-    if processed_count > 0:
-        return jsonify({'success': True, 'message': f'Payroll processed successfully for {processed_count} employees'})
-    return jsonify({'success': False, 'message': 'No eligible active employees found with configured salaries for this period.'}), 400
+    job = payroll_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Payroll job not found'}), 404
+    return jsonify(job)
 
 
 @app.route('/api/payroll/report', methods=['GET'])
@@ -756,8 +1010,27 @@ def api_payroll_report():
     if not period:
         period = datetime.now().strftime('%Y-%m')
 
-    db = Database()
+    db = Database(read_only=True)
     salary_manager = SalaryManager(db)
+
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_json(salary_manager.iter_monthly_payroll_report(period),
+                           stream_format, envelope={'period': period})
+
+    paging = paging_args('department', 'status')
+    if paging is not None:
+        try:
+            page = salary_manager.list_payroll_report(period, **paging)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'period': period,
+            'records': page['items'],
+            'next_cursor': page['next_cursor'],
+            'limit': page['limit']
+        })
+
     report = salary_manager.get_monthly_payroll_report(period)
 
     return jsonify({
@@ -784,6 +1057,28 @@ def api_payslip(employee_id):
     return jsonify({'error': f'No payslip record found for employee in period {period}'}), 404
 
 
+@app.route('/api/admin/query-stats', methods=['GET'])
+def api_query_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return jsonify({
+        'enabled': query_stats.enabled,
+        'slow_query_ms': query_stats.slow_query_ms,
+        'queries': query_stats.snapshot(),
+        'cache': result_cache.stats()
+    })
+
+
+@app.route('/api/admin/query-stats', methods=['DELETE'])
+def api_reset_query_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    query_stats.reset()
+    return jsonify({'success': True, 'message': 'Query statistics reset'})
+
+
 if __name__ == "__main__":
     import sys
     if "--cli" in sys.argv:
@@ -0,0 +1,486 @@
+import os
+import sqlite3
+from urllib.parse import quote
+
+BASELINE_VERSION = 1
+
+
+def _cents(column):
+    return f"CAST(ROUND({column} * 100) AS INTEGER)"
+
+
+def _aggregate_add(row):
+    return f'''
+                INSERT INTO payroll_dept_aggregates (period, department, employee_count,
+                                                     total_base_cents, total_net_cents)
+                SELECT {row}.period, COALESCE({row}.department, ''), 1,
+                       {_cents(f"{row}.base_salary")}, {_cents(f"{row}.net_salary")}
+                WHERE {row}.status = 'processed'
+                ON CONFLICT (period, department) DO UPDATE
+                    SET employee_count   = employee_count + 1,
+                        total_base_cents = total_base_cents
+                                           + excluded.total_base_cents,
+                        total_net_cents  = total_net_cents
+                                           + excluded.total_net_cents;'''
+
+
+def _aggregate_remove(row):
+    return f'''
+                UPDATE payroll_dept_aggregates
+                SET employee_count   = employee_count - 1,
+                    total_base_cents = total_base_cents
+                                       - {_cents(f"{row}.base_salary")},
+                    total_net_cents  = total_net_cents
+                                       - {_cents(f"{row}.net_salary")}
+                WHERE period = {row}.period
+                  AND department = COALESCE({row}.department, '')
+                  AND {row}.status = 'processed';
+                DELETE FROM payroll_dept_aggregates
+                WHERE period = {row}.period
+                  AND department = COALESCE({row}.department, '')
+                  AND employee_count = 0;'''
+
+
+def _payroll_department_aggregates(conn):
+    conn.execute("ALTER TABLE payroll_records ADD COLUMN department TEXT")
+    conn.execute("ALTER TABLE payroll_staging ADD COLUMN department TEXT")
+
+    # Existing records get the employee's current department as their snapshot.
+    main_path = next(row[2] for row in conn.execute("PRAGMA database_list")
+                     if row[1] == 'main')
+    employees_path = None
+    if main_path:
+        employees_path = os.path.join(os.path.dirname(main_path), 'employees.db')
+    if employees_path and os.path.exists(employees_path):
+        employees = sqlite3.connect(f"file:{quote(employees_path)}?mode=ro", uri=True)
+        try:
+            departments = employees.execute(
+                "SELECT department, employee_id FROM employees").fetchall()
+        finally:
+            employees.close()
+        conn.executemany("UPDATE payroll_records SET department = ? "
+                         "WHERE employee_id = ?", departments)
+
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS payroll_dept_aggregates
+                 (
+                     period           TEXT    NOT NULL,
+                     department       TEXT    NOT NULL,
+                     employee_count   INTEGER NOT NULL,
+                     total_base_cents INTEGER NOT NULL,
+                     total_net_cents  INTEGER NOT NULL,
+                     PRIMARY KEY (period, department)
+                 )
+                 ''')
+    conn.execute(f'''
+                 INSERT INTO payroll_dept_aggregates (period, department,
+                                                      employee_count,
+                                                      total_base_cents, total_net_cents)
+                 SELECT period, COALESCE(department, ''), COUNT(*),
+                        SUM({_cents("base_salary")}), SUM({_cents("net_salary")})
+                 FROM payroll_records
+                 WHERE status = 'processed'
+                 GROUP BY period, COALESCE(department, '')
+                 ''')
+    conn.execute(f'''
+                 CREATE TRIGGER IF NOT EXISTS trg_payroll_aggregates_insert
+                 AFTER INSERT ON payroll_records
+                 BEGIN {_aggregate_add("NEW")}
+                 END
+                 ''')
+    conn.execute(f'''
+                 CREATE TRIGGER IF NOT EXISTS trg_payroll_aggregates_update
+                 AFTER UPDATE OF period, department, status, base_salary, net_salary
+                 ON payroll_records
+                 BEGIN {_aggregate_remove("OLD")} {_aggregate_add("NEW")}
+                 END
+                 ''')
+    conn.execute(f'''
+                 CREATE TRIGGER IF NOT EXISTS trg_payroll_aggregates_delete
+                 AFTER DELETE ON payroll_records
+                 BEGIN {_aggregate_remove("OLD")}
+                 END
+                 ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payroll_status_base "
+                 "ON payroll_records (status, base_salary)")
+
+
+def _rollup_add(row):
+    net_cents = _cents(f"{row}.net_salary")
+    return f'''
+                INSERT INTO payroll_dept_aggregates (period, department, employee_count,
+                                                     total_base_cents, total_net_cents,
+                                                     min_net_cents, max_net_cents)
+                SELECT {row}.period, COALESCE({row}.department, ''), 1,
+                       {_cents(f"{row}.base_salary")},
+                       {net_cents}, {net_cents}, {net_cents}
+                WHERE {row}.status = 'processed'
+                ON CONFLICT (period, department) DO UPDATE
+                    SET employee_count   = employee_count + 1,
+                        total_base_cents = total_base_cents
+                                           + excluded.total_base_cents,
+                        total_net_cents  = total_net_cents
+                                           + excluded.total_net_cents,
+                        min_net_cents    = MIN(min_net_cents, excluded.min_net_cents),
+                        max_net_cents    = MAX(max_net_cents,
+                                               excluded.max_net_cents);'''
+
+
+def _rollup_remove(row):
+    # Removing the current min or max re-reads it through idx_payroll_dept_net.
+    extreme = f'''
+                (SELECT {_cents("{function}(net_salary)")} FROM payroll_records
+                 WHERE period = {row}.period
+                   AND department IS {row}.department
+                   AND status = 'processed')'''
+    return f'''
+                UPDATE payroll_dept_aggregates
+                SET employee_count   = employee_count - 1,
+                    total_base_cents = total_base_cents
+                                       - {_cents(f"{row}.base_salary")},
+                    total_net_cents  = total_net_cents
+                                       - {_cents(f"{row}.net_salary")}
+                WHERE period = {row}.period
+                  AND department = COALESCE({row}.department, '')
+                  AND {row}.status = 'processed';
+                UPDATE payroll_dept_aggregates
+                SET min_net_cents = {extreme.format(function="MIN")},
+                    max_net_cents = {extreme.format(function="MAX")}
+                WHERE period = {row}.period
+                  AND department = COALESCE({row}.department, '')
+                  AND {row}.status = 'processed'
+                  AND {_cents(f"{row}.net_salary")} IN (min_net_cents, max_net_cents);
+                DELETE FROM payroll_dept_aggregates
+                WHERE period = {row}.period
+                  AND department = COALESCE({row}.department, '')
+                  AND employee_count = 0;'''
+
+
+def _payroll_rollup_extremes(conn):
+    conn.execute("ALTER TABLE payroll_dept_aggregates ADD COLUMN min_net_cents INTEGER")
+    conn.execute("ALTER TABLE payroll_dept_aggregates ADD COLUMN max_net_cents INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payroll_dept_net "
+                 "ON payroll_records (period, department, net_salary) "
+                 "WHERE status = 'processed'")
+    conn.execute(f'''
+                 UPDATE payroll_dept_aggregates
+                 SET (min_net_cents, max_net_cents) =
+                     (SELECT {_cents("MIN(net_salary)")}, {_cents("MAX(net_salary)")}
+                      FROM payroll_records r
+                      WHERE r.period = payroll_dept_aggregates.period
+                        AND COALESCE(r.department, '')
+                            = payroll_dept_aggregates.department
+                        AND r.status = 'processed')
+                 ''')
+    for trigger in ('insert', 'update', 'delete'):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_payroll_aggregates_{trigger}")
+    conn.execute(f'''
+                 CREATE TRIGGER trg_payroll_aggregates_insert
+                 AFTER INSERT ON payroll_records
+                 BEGIN {_rollup_add("NEW")}
+                 END
+                 ''')
+    conn.execute(f'''
+                 CREATE TRIGGER trg_payroll_aggregates_update
+                 AFTER UPDATE OF period, department, status, base_salary, net_salary
+                 ON payroll_records
+                 BEGIN {_rollup_remove("OLD")} {_rollup_add("NEW")}
+                 END
+                 ''')
+    conn.execute(f'''
+                 CREATE TRIGGER trg_payroll_aggregates_delete
+                 AFTER DELETE ON payroll_records
+                 BEGIN {_rollup_remove("OLD")}
+                 END
+                 ''')
+
+
+# Ordered schema changes applied after the baseline tables created by
+# Database.init_*_db. Each step is (version, description, statements) where
+# statements is a list of SQL strings or a callable taking the connection.
+MIGRATIONS = {
+    'admin': [],
+    'employees': [
+        (2, "index employees by department and name", [
+            "CREATE INDEX IF NOT EXISTS idx_employees_department_name "
+            "ON employees (department, last_name, first_name)",
+        ]),
+        (3, "track when employees change", [
+            "ALTER TABLE employees ADD COLUMN updated_at TIMESTAMP",
+            "CREATE INDEX IF NOT EXISTS idx_employees_changed "
+            "ON employees (COALESCE(updated_at, created_at))",
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_employees_updated_at
+            AFTER UPDATE ON employees
+            WHEN NEW.updated_at IS OLD.updated_at
+            BEGIN
+                UPDATE employees SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+            ''',
+        ]),
+        (4, "indexes for keyset pagination of employees", [
+            "CREATE INDEX IF NOT EXISTS idx_employees_name "
+            "ON employees (last_name, first_name, employee_id)",
+            "CREATE INDEX IF NOT EXISTS idx_employees_department_sort "
+            "ON employees (department, last_name, first_name, employee_id)",
+            "DROP INDEX IF EXISTS idx_employees_department_name",
+            "CREATE INDEX IF NOT EXISTS idx_employees_hire_date "
+            "ON employees (hire_date, employee_id)",
+        ]),
+        (5, "log deleted employees for incremental pay runs", [
+            '''
+            CREATE TABLE IF NOT EXISTS employee_deletions
+            (
+                employee_id TEXT NOT NULL,
+                deleted_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_employee_deletions_deleted_at "
+            "ON employee_deletions (deleted_at)",
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_employees_deleted
+            AFTER DELETE ON employees
+            BEGIN
+                INSERT INTO employee_deletions (employee_id) VALUES (OLD.employee_id);
+            END
+            ''',
+        ]),
+    ],
+    'salary': [
+        (2, "index salaries by employee and effective date", [
+            "CREATE INDEX IF NOT EXISTS idx_salaries_employee_effective "
+            "ON salaries (employee_id, effective_date)",
+        ]),
+        (3, "track when salaries change", [
+            "ALTER TABLE salaries ADD COLUMN updated_at TIMESTAMP",
+            "CREATE INDEX IF NOT EXISTS idx_salaries_changed "
+            "ON salaries (COALESCE(updated_at, created_at))",
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_salaries_updated_at
+            AFTER UPDATE ON salaries
+            WHEN NEW.updated_at IS OLD.updated_at
+            BEGIN
+                UPDATE salaries SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS salary_deletions
+            (
+                employee_id TEXT NOT NULL,
+                deleted_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_salary_deletions_deleted_at "
+            "ON salary_deletions (deleted_at)",
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_salaries_deleted
+            AFTER DELETE ON salaries
+            BEGIN
+                INSERT INTO salary_deletions (employee_id) VALUES (OLD.employee_id);
+            END
+            ''',
+        ]),
+    ],
+    'payroll': [
+        (2, "index payroll records by period and status", [
+            "CREATE INDEX IF NOT EXISTS idx_payroll_period_employee "
+            "ON payroll_records (period, employee_id)",
+            "CREATE INDEX IF NOT EXISTS idx_payroll_status "
+            "ON payroll_records (status)",
+        ]),
+        (3, "one payroll record per employee and period", [
+            "DELETE FROM payroll_records WHERE id NOT IN "
+            "(SELECT MAX(id) FROM payroll_records GROUP BY employee_id, period)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_payroll_employee_period "
+            "ON payroll_records (employee_id, period)",
+            '''
+            CREATE TABLE IF NOT EXISTS payroll_periods
+            (
+                period         TEXT PRIMARY KEY,
+                processed_at   TIMESTAMP NOT NULL,
+                employee_count INTEGER   NOT NULL
+            )
+            ''',
+        ]),
+        (4, "resumable pay runs with checkpoints and a staging table", [
+            '''
+            CREATE TABLE IF NOT EXISTS payroll_runs
+            (
+                run_id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                period           TEXT      NOT NULL,
+                status           TEXT      NOT NULL DEFAULT 'running',
+                incremental      INTEGER   NOT NULL DEFAULT 0,
+                since            TIMESTAMP,
+                last_employee_id TEXT,
+                processed        INTEGER   NOT NULL DEFAULT 0,
+                started_at       TIMESTAMP NOT NULL,
+                checkpoint_at    TIMESTAMP,
+                completed_at     TIMESTAMP
+            )
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_payroll_runs_period_status "
+            "ON payroll_runs (period, status)",
+            '''
+            CREATE TABLE IF NOT EXISTS payroll_staging
+            (
+                run_id      INTEGER NOT NULL,
+                employee_id TEXT    NOT NULL,
+                base_salary REAL,
+                allowances  REAL,
+                deductions  REAL,
+                net_salary  REAL,
+                removed     INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (run_id, employee_id)
+            )
+            ''',
+        ]),
+        (5, "department snapshot and per-period department aggregates",
+         _payroll_department_aggregates),
+        (6, "cache versions bumped by payroll writes", [
+            '''
+            CREATE TABLE IF NOT EXISTS cache_versions
+            (
+                scope   TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            ''',
+            # Pay runs finish by updating payroll_periods; corrections are caught
+            # row by row (inserts since version 10).
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_payroll_periods_version
+            AFTER INSERT ON payroll_periods
+            BEGIN
+                INSERT INTO cache_versions (scope, version)
+                VALUES (NEW.period, 1), ('*', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_payroll_periods_version_update
+            AFTER UPDATE ON payroll_periods
+            BEGIN
+                INSERT INTO cache_versions (scope, version)
+                VALUES (NEW.period, 1), ('*', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_payroll_records_version_update
+            AFTER UPDATE ON payroll_records
+            BEGIN
+                INSERT INTO cache_versions (scope, version)
+                VALUES (OLD.period, 1), (NEW.period, 1), ('*', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_payroll_records_version_delete
+            AFTER DELETE ON payroll_records
+            BEGIN
+                INSERT INTO cache_versions (scope, version)
+                VALUES (OLD.period, 1), ('*', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            END
+            ''',
+        ]),
+        (7, "indexes for keyset pagination of payroll reports", [
+            "CREATE INDEX IF NOT EXISTS idx_payroll_period_net "
+            "ON payroll_records (period, net_salary, employee_id)",
+            "CREATE INDEX IF NOT EXISTS idx_payroll_period_department "
+            "ON payroll_records (period, department, employee_id)",
+        ]),
+        (8, "min and max net pay in the department aggregates",
+         _payroll_rollup_extremes),
+        (9, "stored quantile sketches and histograms per department", [
+            '''
+            CREATE TABLE IF NOT EXISTS payroll_distribution_periods
+            (
+                period         TEXT PRIMARY KEY,
+                source_version INTEGER NOT NULL,
+                row_count      INTEGER NOT NULL,
+                bucket_width   INTEGER NOT NULL,
+                built_at       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS payroll_distributions
+            (
+                period     TEXT NOT NULL,
+                metric     TEXT NOT NULL,
+                department TEXT NOT NULL,
+                sketch     TEXT NOT NULL,
+                histogram  TEXT NOT NULL,
+                PRIMARY KEY (period, metric, department)
+            )
+            ''',
+        ]),
+        (10, "bump cache versions on inserted payroll records", [
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_payroll_records_version_insert
+            AFTER INSERT ON payroll_records
+            BEGIN
+                INSERT INTO cache_versions (scope, version)
+                VALUES (NEW.period, 1), ('*', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            END
+            ''',
+        ]),
+    ],
+}
+
+
+def latest_version(db_name):
+    steps = MIGRATIONS[db_name]
+    return steps[-1][0] if steps else BASELINE_VERSION
+
+
+def current_version(conn):
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS schema_version
+                 (
+                     version     INTEGER PRIMARY KEY,
+                     description TEXT NOT NULL,
+                     applied_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                 )
+                 ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, db_name, baseline):
+    """Bring one database up to the latest schema version; returns applied versions."""
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    applied = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = current_version(conn)
+            if version < BASELINE_VERSION:
+                baseline(conn)
+                _record(conn, BASELINE_VERSION, "baseline schema")
+                applied.append(BASELINE_VERSION)
+                version = BASELINE_VERSION
+
+            for step_version, description, statements in MIGRATIONS[db_name]:
+                if step_version <= version:
+                    continue
+                if callable(statements):
+                    statements(conn)
+                else:
+                    for statement in statements:
+                        conn.execute(statement)
+                _record(conn, step_version, description)
+                applied.append(step_version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def _record(conn, version, description):
+    conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                 (version, description))
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+
+
+class Record:
+    """Row type with dict-style access so callers can keep using record['field']."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def columns(cls, alias=None):
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(prefix + field for field in cls.__slots__)
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return cls(*row)
+
+
+@dataclass(slots=True)
+class Employee(Record):
+    id: int
+    employee_id: str
+    first_name: str
+    last_name: str
+    email: str
+    phone: str
+    department: str
+    position: str
+    hire_date: str
+    status: str
+    created_at: str
+
+
+@dataclass(slots=True)
+class SalaryRecord(Record):
+    id: int
+    employee_id: str
+    base_salary: float
+    allowances: float
+    deductions: float
+    effective_date: str
+    created_at: str
+
+
+@dataclass(slots=True)
+class PayrollRecord(Record):
+    id: int
+    employee_id: str
+    period: str
+    base_salary: float
+    allowances: float
+    deductions: float
+    net_salary: float
+    payment_date: str
+    status: str
+    first_name: str
+    last_name: str
+    department: str
+    position: str
+
+
+@dataclass(slots=True)
+class PayrollChange(Record):
+    employee_id: str
+    change: str
+    first_name: str
+    last_name: str
+    department: str
+    previous_base_salary: float
+    current_base_salary: float
+    previous_net_salary: float
+    current_net_salary: float
+    net_delta: float
@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_name, values):
+    payload = json.dumps([sort_name] + list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_name, width):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor") from None
+    if (not isinstance(payload, list) or payload[:1] != [sort_name]
+            or len(payload) != width + 1):
+        raise ValueError("Cursor does not belong to this sort order")
+    # The values are bound as SQL parameters, which only take scalars.
+    if not all(isinstance(value, (str, int, float)) or value is None
+               for value in payload[1:]):
+        raise ValueError("Invalid cursor")
+    return payload[1:]
+
+
+def page_size(limit):
+    limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def fetch_page(db, db_name, select, conditions, params, sorts, sort, order, limit,
+               cursor, attach=(), row_factory=None):
+    """One keyset page of select; returns {'items', 'next_cursor', 'limit'}."""
+    # sorts maps a whitelisted sort name to (sql expression, row field) pairs
+    # ending in a unique key. The cursor holds the last row's values for those
+    # columns, so every page is an index range scan that starts where the
+    # previous page stopped instead of an OFFSET over all earlier rows.
+    if sort not in sorts:
+        raise ValueError(f"Unknown sort '{sort}'; use one of {', '.join(sorts)}")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    limit = page_size(limit)
+    columns = sorts[sort]
+    sort_name = f"{sort}:{order}"
+    conditions = list(conditions)
+    params = list(params)
+
+    if cursor:
+        values = decode_cursor(cursor, sort_name, len(columns))
+        placeholders = ", ".join("?" for _ in columns)
+        expressions = ", ".join(expression for expression, _ in columns)
+        operator = '>' if order == 'asc' else '<'
+        conditions.append(f"({expressions}) {operator} ({placeholders})")
+        params.extend(values)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_by = ", ".join(f"{expression} {order.upper()}" for expression, _ in columns)
+    query = f"{select}{where} ORDER BY {order_by} LIMIT ?"
+    rows = db.execute_query(db_name, query, params + [limit + 1], attach=attach,
+                            row_factory=row_factory)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_name,
+                                    [rows[-1][field] for _, field in columns])
+    return {'items': rows, 'next_cursor': next_cursor, 'limit': limit}
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import Database, is_serverless
+from salary_manager import SalaryManager
+
+JOB_WORKERS = int(os.environ.get('PAYROLL_JOB_WORKERS', '2'))
+JOB_CHUNK_SIZE = int(os.environ.get('PAYROLL_JOB_CHUNK_SIZE', '1000'))
+JOB_HISTORY = 100
+
+
+class PayrollJobManager:
+    """Runs pay runs on a worker pool and keeps their progress for polling.
+
+    A serverless instance may be frozen once its response is sent and the next
+    poll may reach another instance, so there jobs run inside submit().
+    """
+
+    def __init__(self, database_factory=Database, max_workers=JOB_WORKERS,
+                 chunk_size=JOB_CHUNK_SIZE, synchronous=None):
+        self.database_factory = database_factory
+        self.chunk_size = chunk_size
+        self.synchronous = is_serverless() if synchronous is None else synchronous
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='payroll-job')
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, period, incremental=False):
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'job_id': job_id,
+            'period': period,
+            'incremental': incremental,
+            'status': 'queued',
+            'processed': 0,
+            'total': None,
+            'result': None,
+            'errors': [],
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        with self._lock:
+            # A period has at most one queued or running job; resubmitting it,
+            # e.g. a retried request, returns the job already in flight.
+            if period in self._active:
+                return self._active[period]
+            self._jobs[job_id] = job
+            self._active[period] = job_id
+            self._trim_history()
+        if self.synchronous:
+            self._run(job_id)
+        else:
+            self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job, errors=list(job['errors']))
+
+        end = snapshot['finished_at'] or time.time()
+        started = snapshot['started_at']
+        snapshot['elapsed'] = end - started if started else 0.0
+        return snapshot
+
+    def wait(self, job_id, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in ('completed', 'failed'):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(0.01)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            finished = job['status'] in ('completed', 'failed')
+            if finished and self._active.get(job['period']) == job_id:
+                del self._active[job['period']]
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        self._update(job_id, status='running', started_at=time.time())
+
+        def progress(processed, total):
+            self._update(job_id, processed=processed, total=total)
+
+        try:
+            salary_manager = SalaryManager(self.database_factory())
+            result = salary_manager.run_payroll(job['period'],
+                                                incremental=job['incremental'],
+                                                chunk_size=self.chunk_size,
+                                                progress=progress)
+            self._update(job_id, status='completed', result=result,
+                         finished_at=time.time())
+        except Exception as e:
+            with self._lock:
+                self._jobs[job_id]['errors'].append(str(e))
+            self._update(job_id, status='failed', finished_at=time.time())
+
+    def _trim_history(self):
+        finished = [j for j in self._jobs.values()
+                    if j['status'] in ('completed', 'failed')]
+        finished.sort(key=lambda j: j['created_at'])
+        while len(self._jobs) > JOB_HISTORY and finished:
+            del self._jobs[finished.pop(0)['job_id']]
+
+
+payroll_jobs = PayrollJobManager()
@@ -0,0 +1,163 @@
+import os
+import random
+from math import ceil
+
+SKETCH_K = int(os.environ.get('PAYROLL_SKETCH_K', '200'))
+HISTOGRAM_BUCKET_CENTS = int(
+    float(os.environ.get('PAYROLL_HISTOGRAM_BUCKET', '500')) * 100)
+
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch; ranks are within about 1.7 / k of the count."""
+
+    def __init__(self, k=SKETCH_K, seed=None):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = k
+        self.count = 0
+        self.min = self.max = None
+        self._levels = [[]]
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        # The top level holds k items and each level below two thirds of the
+        # one above it, so memory stays O(k) however many values are added.
+        depth = len(self._levels) - level - 1
+        return max(2, ceil(self.k * (2 / 3) ** depth))
+
+    def _grow(self):
+        self._levels.append([])
+        self._max_size = sum(self._capacity(level)
+                             for level in range(len(self._levels)))
+
+    def _compress(self):
+        # Sorts the lowest full level and promotes every other item, starting
+        # at a random offset, to the level above where it counts twice.
+        for level in range(len(self._levels)):
+            items = self._levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self._levels):
+                self._grow()
+            items.sort()
+            keep = [items.pop(0)] if len(items) % 2 else []
+            self._levels[level + 1].extend(items[self._random.getrandbits(1)::2])
+            self._levels[level] = keep
+            self._size = sum(len(items) for items in self._levels)
+            if self._size < self._max_size:
+                break
+
+    def add(self, value):
+        self._levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Adds other's values to this sketch; the result sketches both streams."""
+        if not other.count:
+            return self
+        while len(self._levels) < len(other._levels):
+            self._grow()
+        for level, items in enumerate(other._levels):
+            self._levels[level].extend(items)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._size = sum(len(items) for items in self._levels)
+        while self._size >= self._max_size:
+            self._compress()
+        return self
+
+    def quantiles(self, fractions):
+        """Values at each fraction of the sorted stream, None when empty."""
+        for fraction in fractions:
+            if not 0 <= fraction <= 1:
+                raise ValueError(f"Quantile must be between 0 and 1: {fraction}")
+        if not self.count:
+            return [None for _ in fractions]
+
+        weighted = sorted((value, 1 << level)
+                          for level, items in enumerate(self._levels)
+                          for value in items)
+        results = []
+        for fraction in fractions:
+            if fraction == 0:
+                results.append(self.min)
+                continue
+            if fraction == 1:
+                results.append(self.max)
+                continue
+            target = fraction * self.count
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def quantile(self, fraction):
+        return self.quantiles([fraction])[0]
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'min': self.min, 'max': self.max,
+                'levels': self._levels}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data['k'], seed)
+        sketch.count = data['count']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch._levels = [list(items) for items in data['levels']] or [[]]
+        sketch._size = sum(len(items) for items in sketch._levels)
+        sketch._max_size = sum(sketch._capacity(level)
+                               for level in range(len(sketch._levels)))
+        return sketch
+
+
+class Histogram:
+    """Counts per fixed-width bucket; same-width histograms merge by adding counts."""
+
+    def __init__(self, bucket_width=HISTOGRAM_BUCKET_CENTS):
+        if bucket_width <= 0:
+            raise ValueError("bucket_width must be positive")
+        self.bucket_width = bucket_width
+        self.counts = {}
+
+    def add(self, value):
+        bucket = value // self.bucket_width
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+    def merge(self, other):
+        if other.bucket_width != self.bucket_width:
+            raise ValueError(f"Cannot merge histograms with bucket widths "
+                             f"{self.bucket_width} and {other.bucket_width}")
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    def buckets(self):
+        """(lower, upper, count) for every non-empty bucket, lowest first."""
+        return [(bucket * self.bucket_width, (bucket + 1) * self.bucket_width, count)
+                for bucket, count in sorted(self.counts.items())]
+
+    def to_dict(self):
+        return {'bucket_width': self.bucket_width,
+                'counts': sorted(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['bucket_width'])
+        histogram.counts = {bucket: count for bucket, count in data['counts']}
+        return histogram
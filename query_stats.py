@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Per-statement timing collected by Database when instrumentation is enabled."""
+
+    def __init__(self, enabled=False, slow_query_ms=100.0):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def enable(self, slow_query_ms=None):
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def record(self, db_name, query, elapsed_ms, rows):
+        key = (db_name, ' '.join(query.split()))
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                            'rows': 0}
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += rows
+
+    def is_slow(self, elapsed_ms):
+        return elapsed_ms >= self.slow_query_ms
+
+    def log_slow_query(self, db_name, query, params, elapsed_ms, conn):
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            plan_text = '; '.join(row[3] for row in plan)
+        except Exception as e:
+            plan_text = f"unavailable ({e})"
+        logger.warning("Slow query on %s (%.1f ms): %s | plan: %s",
+                       db_name, elapsed_ms, ' '.join(query.split()), plan_text)
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._stats.items()]
+
+        stats = []
+        for (db_name, query), entry in items:
+            stats.append({
+                'database': db_name,
+                'query': query,
+                'count': entry['count'],
+                'total_ms': entry['total_ms'],
+                'avg_ms': entry['total_ms'] / entry['count'],
+                'max_ms': entry['max_ms'],
+                'rows': entry['rows']
+            })
+        stats.sort(key=lambda x: x['total_ms'], reverse=True)
+        return stats
+
+
+query_stats = QueryStats(
+    enabled=os.environ.get('PAYROLL_QUERY_STATS') == '1',
+    slow_query_ms=float(os.environ.get('PAYROLL_SLOW_QUERY_MS', '100')))
@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+CACHE_ENABLED = os.environ.get('PAYROLL_CACHE', '1') == '1'
+CACHE_MAX_ENTRIES = int(os.environ.get('PAYROLL_CACHE_MAX_ENTRIES', '256'))
+CACHE_MAX_BYTES = int(os.environ.get('PAYROLL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Scope bumped by the payroll triggers whenever any period changes.
+ALL_PERIODS = '*'
+
+
+def estimate_size(value):
+    """Rough deep size of a cached result in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    elif hasattr(value, '__slots__') and not isinstance(value, type):
+        size += sum(estimate_size(getattr(value, field, None))
+                    for field in value.__slots__)
+    return size
+
+
+class ResultCache:
+    """LRU cache of report results, invalidated by per-scope data versions."""
+
+    def __init__(self, enabled=True, max_entries=CACHE_MAX_ENTRIES,
+                 max_bytes=CACHE_MAX_BYTES):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._monitors = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+        self.hits = self.misses = 0
+
+    def get(self, db, key, scopes, compute):
+        """Returns the cached compute() result for key until one of scopes changes."""
+        if not self.enabled:
+            return compute()
+
+        db_dir = os.path.abspath(db.db_dir)
+        cache_key = (db_dir,) + tuple(key)
+        with self._lock:
+            versions = self._scope_versions(db, db_dir)
+            stamp = tuple(versions.get(scope, 0) for scope in scopes)
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Computed outside the lock; a write racing with it only bumps the
+        # versions, so the entry stored under the older stamp is never served.
+        value = compute()
+        size = estimate_size(value)
+        with self._lock:
+            self._discard(cache_key)
+            if size <= self.max_bytes:
+                self._entries[cache_key] = (stamp, value, size)
+                self._bytes += size
+                self._evict()
+        return value
+
+    def _scope_versions(self, db, db_dir):
+        # PRAGMA data_version changes when any other connection (including
+        # other processes) commits to the database, so the version tables are
+        # only re-read after a write.
+        versions = self._versions.setdefault(db_dir, {'employees': 0})
+        for db_name in ("payroll", "employees"):
+            monitor, last_seen = self._monitors.get((db_dir, db_name), (None, None))
+            if monitor is None:
+                monitor = db.get_connection(db_name, read_only=True)
+            data_version = monitor.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == last_seen:
+                continue
+            self._monitors[(db_dir, db_name)] = (monitor, data_version)
+            if db_name == "payroll":
+                versions.update(monitor.execute(
+                    "SELECT scope, version FROM cache_versions").fetchall())
+            elif last_seen is not None:
+                versions['employees'] += 1
+        return versions
+
+    def _discard(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._versions.clear()
+            for monitor, _ in self._monitors.values():
+                monitor.close()
+            self._monitors.clear()
+
+
+result_cache = ResultCache(enabled=CACHE_ENABLED)
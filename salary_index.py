@@ -0,0 +1,53 @@
+import calendar
+from bisect import bisect_right
+from datetime import datetime
+
+
+def period_end(period):
+    """Last day of a YYYY-MM pay period, the date salaries are resolved as of."""
+    start = datetime.strptime(period, '%Y-%m')
+    return f"{period}-{calendar.monthrange(start.year, start.month)[1]:02d}"
+
+
+def period_range(start_period, end_period):
+    """YYYY-MM periods from start_period to end_period inclusive."""
+    start = datetime.strptime(start_period, '%Y-%m')
+    end = datetime.strptime(end_period, '%Y-%m')
+    if start > end:
+        raise ValueError(f"Period range starts after it ends: "
+                         f"{start_period} > {end_period}")
+    periods = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        periods.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+class SalaryIndex:
+    """Salary history per employee with sorted effective dates for as-of lookups."""
+
+    def __init__(self, records):
+        # records must be ordered by employee_id, effective_date, id so the
+        # latest of several rows sharing an effective date wins, as in SQL.
+        self._dates = {}
+        self._records = {}
+        for record in records:
+            self._dates.setdefault(record.employee_id, []).append(record.effective_date)
+            self._records.setdefault(record.employee_id, []).append(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, employee_id):
+        return employee_id in self._records
+
+    def as_of(self, employee_id, date):
+        dates = self._dates.get(employee_id)
+        if not dates:
+            return None
+        position = bisect_right(dates, date)
+        return self._records[employee_id][position - 1] if position else None
+
+    def history(self, employee_id):
+        return list(self._records.get(employee_id, ()))
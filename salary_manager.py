@@ -1,4 +1,17 @@
-from datetime import datetime
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from models import PayrollChange, PayrollRecord, SalaryRecord
+from pagination import fetch_page
+from payroll_engine import net_pay_sql, to_cents
+from quantile_sketch import HISTOGRAM_BUCKET_CENTS, Histogram, KLLSketch
+from result_cache import ALL_PERIODS, result_cache
+from salary_index import SalaryIndex, period_end, period_range
+
+
+class PayrollRunSuperseded(RuntimeError):
+    """Raised when a pay run finds that a newer run for its period took over."""
 
 
 class SalaryManager:
@@ -24,47 +37,58 @@ class SalaryManager:
             return False
 
     def get_salary_history(self, employee_id):
-        query = '''
-                SELECT * \
+        query = f'''
+                SELECT {SalaryRecord.columns()}
                 FROM salaries
                 WHERE employee_id = ?
                 ORDER BY effective_date DESC \
                 '''
-        results = self.db.execute_query("salary", query, (employee_id,))
+        return self.db.execute_query("salary", query, (employee_id,),
+                                     row_factory=SalaryRecord.row_factory)
 
-        salaries = []
-        for row in results:
-            salaries.append({
-                'id': row[0],
-                'employee_id': row[1],
-                'base_salary': row[2],
-                'allowances': row[3],
-                'deductions': row[4],
-                'effective_date': row[5],
-                'created_at': row[6]
-            })
-        return salaries
+    SALARY_HISTORY_SORTS = {
+        'effective_date': (('effective_date', 'effective_date'), ('id', 'id'))
+    }
+
+    def list_salary_history(self, employee_id, limit=None, cursor=None, order='desc'):
+        select = f"SELECT {SalaryRecord.columns()} FROM salaries"
+        return fetch_page(self.db, "salary", select,
+                          ["employee_id = ?"], [employee_id], self.SALARY_HISTORY_SORTS,
+                          'effective_date', order, limit, cursor,
+                          row_factory=SalaryRecord.row_factory)
 
     def get_current_salary(self, employee_id):
-        query = '''
-                SELECT * \
+        return self.get_salary_as_of(employee_id, datetime.now().strftime('%Y-%m-%d'))
+
+    def get_salary_as_of(self, employee_id, date):
+        query = f'''
+                SELECT {SalaryRecord.columns()}
                 FROM salaries
                 WHERE employee_id = ?
-                ORDER BY effective_date DESC LIMIT 1 \
+                  AND effective_date <= ?
+                ORDER BY effective_date DESC, id DESC LIMIT 1 \
                 '''
-        result = self.db.execute_single("salary", query, (employee_id,))
-
-        if result:
-            return {
-                'id': result[0],
-                'employee_id': result[1],
-                'base_salary': result[2],
-                'allowances': result[3],
-                'deductions': result[4],
-                'effective_date': result[5],
-                'created_at': result[6]
-            }
-        return None
+        return self.db.execute_single("salary", query, (employee_id, date),
+                                      row_factory=SalaryRecord.row_factory)
+
+    def build_salary_index(self, partition=None, partitions=None):
+        # One ordered scan of salaries (served by idx_salaries_employee_effective).
+        salary_filter = ""
+        params = {}
+        attach = ()
+        if partitions:
+            salary_filter = ("WHERE employee_id IN (SELECT employee_id "
+                             "FROM employees.employees "
+                             "WHERE id % :partitions = :partition)")
+            params = {'partition': partition, 'partitions': partitions}
+            attach = ("employees",)
+        query = f'''
+                SELECT {SalaryRecord.columns()}
+                FROM salaries {salary_filter}
+                ORDER BY employee_id, effective_date, id \
+                '''
+        return SalaryIndex(self.db.execute_query("salary", query, params, attach=attach,
+                                                 row_factory=SalaryRecord.row_factory))
 
     def update_salary(self, salary_id, updates):
         set_clauses = []
@@ -94,189 +118,846 @@ class SalaryManager:
         except:
             return False
 
-    def process_payroll(self, period):
-        from employee_manager import EmployeeManager
-
-        employee_manager = EmployeeManager(self.db)
-        employees = employee_manager.get_all_employees()
-
-        processed_count = 0
-
-        for employee in employees:
-            if employee['status'] != 'active':
-                continue
-
-            salary = self.get_current_salary(employee['employee_id'])
-            if not salary:
-                continue
-
-            net_salary = salary['base_salary'] + salary['allowances'] - salary['deductions']
+    def set_salaries(self, salaries):
+        """All-or-nothing insert; returns 0 if a row breaks a constraint."""
+        query = '''
+                INSERT INTO salaries (employee_id, base_salary, allowances, deductions,
+                                      effective_date)
+                VALUES (?, ?, ?, ?, ?) \
+                '''
+        rows = [(s['employee_id'], s['base_salary'], s['allowances'], s['deductions'],
+                 s['effective_date'])
+                for s in salaries]
 
-            query = '''
-                    INSERT INTO payroll_records (employee_id, period, base_salary, allowances, deductions, net_salary)
-                    VALUES (?, ?, ?, ?, ?, ?) \
+        try:
+            with self.db.transaction("salary"):
+                return self.db.execute_many("salary", query, rows)
+        except sqlite3.IntegrityError:
+            return 0
+
+    # Net pay is computed in integer cents like payroll_engine's engines, so a
+    # re-run with another engine leaves unchanged rows untouched.
+    ELIGIBLE_SALARIES = f'''
+                SELECT s.employee_id, s.base_salary, s.allowances, s.deductions,
+                       {net_pay_sql('s.base_salary', 's.allowances', 's.deductions')}
+                           AS net_salary,
+                       e.department
+                FROM (SELECT employee_id, base_salary, allowances, deductions,
+                             ROW_NUMBER() OVER (PARTITION BY employee_id
+                                 ORDER BY effective_date DESC, id DESC) AS rn
+                      FROM salary.salaries
+                      WHERE effective_date <= :as_of {{salary_filter}}) s
+                JOIN employees.employees e ON e.employee_id = s.employee_id
+                WHERE s.rn = 1
+                  AND e.status = 'active' '''
+
+    CHANGED_EMPLOYEES = '''
+                SELECT employee_id FROM employees.employees
+                WHERE COALESCE(updated_at, created_at) >= :since
+                UNION
+                SELECT employee_id FROM salary.salaries
+                WHERE COALESCE(updated_at, created_at) >= :since
+                UNION
+                SELECT employee_id FROM salary.salary_deletions
+                WHERE deleted_at >= :since
+                UNION
+                SELECT employee_id FROM employees.employee_deletions
+                WHERE deleted_at >= :since '''
+
+    # Records of past periods are history: an employee who still exists and
+    # had a salary by the period end keeps their record when the period is
+    # re-run or backfilled, even if they are inactive today. Only the current
+    # period and later drop inactive employees.
+    PAID_HISTORY = '''
+                SELECT e.employee_id
+                FROM employees.employees e
+                WHERE :period < :current_period
+                  AND EXISTS (SELECT 1 FROM salary.salaries h
+                              WHERE h.employee_id = e.employee_id
+                                AND h.effective_date <= :as_of) '''
+
+    @staticmethod
+    def _current_period():
+        return datetime.now().strftime('%Y-%m')
+
+    def _payroll_ranges(self, chunk_size):
+        if not chunk_size:
+            return [(None, None)]
+        query = '''
+                SELECT employee_id
+                FROM (SELECT employee_id, ROW_NUMBER() OVER (ORDER BY employee_id) AS rn
+                      FROM employees)
+                WHERE rn % ? = 0 \
+                '''
+        bounds = [row[0] for row in
+                  self.db.execute_query("employees", query, (chunk_size,))]
+        edges = [None] + bounds + [None]
+        return list(zip(edges[:-1], edges[1:]))
+
+    @staticmethod
+    def _range_filter(after, upto):
+        bounds = ""
+        if after is not None:
+            bounds += " AND employee_id > :after"
+        if upto is not None:
+            bounds += " AND employee_id <= :upto"
+        return bounds
+
+    PAYROLL_ATTACH = ("employees", "salary")
+
+    UPSERT_PAYROLL = '''
+                INSERT INTO payroll_records (employee_id, period, base_salary,
+                                             allowances, deductions, net_salary,
+                                             department)
+                {source}
+                ON CONFLICT (employee_id, period) DO UPDATE
+                    SET base_salary = excluded.base_salary,
+                        allowances  = excluded.allowances,
+                        deductions  = excluded.deductions,
+                        net_salary  = excluded.net_salary,
+                        department  = excluded.department
+                WHERE base_salary IS NOT excluded.base_salary
+                   OR allowances IS NOT excluded.allowances
+                   OR deductions IS NOT excluded.deductions
+                   OR net_salary IS NOT excluded.net_salary
+                   OR department IS NOT excluded.department '''
+
+    # Rows computed outside SQLite take the employee's department at write time.
+    PAYROLL_VALUES = "VALUES (?1, ?2, ?3, ?4, ?5, ?6, " \
+                     "(SELECT department FROM employees.employees " \
+                     "WHERE employee_id = ?1))"
+
+    def _active_employee_ids(self, partition=None, partitions=None):
+        employee_filter = ""
+        params = {}
+        if partitions:
+            employee_filter = " AND id % :partitions = :partition"
+            params = {'partition': partition, 'partitions': partitions}
+        query = ("SELECT employee_id FROM employees "
+                 f"WHERE status = 'active'{employee_filter}")
+        return [row[0] for row in self.db.execute_query("employees", query, params)]
+
+    @staticmethod
+    def _resolve_salaries(employee_ids, salary_index, as_of):
+        rows = []
+        for employee_id in employee_ids:
+            salary = salary_index.as_of(employee_id, as_of)
+            if salary is not None:
+                rows.append((employee_id, salary.base_salary, salary.allowances,
+                             salary.deductions))
+        return rows
+
+    def get_eligible_salaries(self, as_of, partition=None, partitions=None):
+        # Active employees with the salary effective on as_of, resolved against
+        # an in-memory SalaryIndex instead of one query per employee.
+        return self._resolve_salaries(self._active_employee_ids(partition, partitions),
+                                      self.build_salary_index(partition, partitions),
+                                      as_of)
+
+    def _remove_ineligible(self, params, filters=""):
+        eligible = self.ELIGIBLE_SALARIES.format(salary_filter=filters)
+        query = f'''
+                DELETE FROM payroll_records
+                WHERE period = :period{filters}
+                  AND employee_id NOT IN (SELECT employee_id FROM ({eligible}))
+                  AND employee_id NOT IN ({self.PAID_HISTORY}) \
+                '''
+        params = dict(params, current_period=self._current_period())
+        return self.db.execute_rowcount("payroll", query, params,
+                                        attach=self.PAYROLL_ATTACH)
+
+    def _record_period(self, period, started_at):
+        employee_count = self.db.execute_single(
+            "payroll", "SELECT COUNT(*) FROM payroll_records WHERE period = ?",
+            (period,))[0]
+        self.db.execute_update("payroll", '''
+                INSERT INTO payroll_periods (period, processed_at, employee_count)
+                VALUES (?, ?, ?)
+                ON CONFLICT (period) DO UPDATE
+                    SET processed_at   = excluded.processed_at,
+                        employee_count = excluded.employee_count \
+                ''', (period, started_at, employee_count))
+        # Every pay run, engine and backfill ends here, so the period's
+        # sketches are stored with its records and reads never have to write.
+        self._build_distributions(period)
+        return employee_count
+
+    def write_payroll_rows(self, period, rows, started_at):
+        # Single writer for rows computed outside SQLite: rows are
+        # (employee_id, base_salary, allowances, deductions, net_salary).
+        upsert = self.UPSERT_PAYROLL.format(source=self.PAYROLL_VALUES)
+        with self.db.transaction("payroll", attach=self.PAYROLL_ATTACH):
+            self.db.execute_many("payroll", upsert,
+                                 [(row[0], period, row[1], row[2], row[3], row[4])
+                                  for row in rows])
+            self._remove_ineligible({'period': period, 'as_of': period_end(period)})
+            return self._record_period(period, started_at)
+
+    def _unfinished_run(self, period):
+        return self.db.execute_single("payroll", '''
+                SELECT run_id, incremental, since, last_employee_id, processed,
+                       started_at, status
+                FROM payroll_runs
+                WHERE period = ?
+                  AND status IN ('running', 'staged')
+                ORDER BY run_id DESC LIMIT 1 \
+                ''', (period,))
+
+    def _start_run(self, period, incremental, since, started_at):
+        with self.db.transaction("payroll"):
+            # A new run supersedes any interrupted one for the same period.
+            self.db.execute_update("payroll", '''
+                    DELETE FROM payroll_staging
+                    WHERE run_id IN (SELECT run_id FROM payroll_runs
+                                     WHERE period = ?
+                                       AND status IN ('running', 'staged')) \
+                    ''', (period,))
+            self.db.execute_update("payroll", '''
+                    UPDATE payroll_runs SET status = 'abandoned'
+                    WHERE period = ?
+                      AND status IN ('running', 'staged') \
+                    ''', (period,))
+            run_id = self.db.execute_update("payroll", '''
+                    INSERT INTO payroll_runs (period, incremental, since, started_at,
+                                              checkpoint_at)
+                    VALUES (?, ?, ?, ?, ?) \
+                    ''', (period, int(incremental), since, started_at, started_at))
+        return run_id, int(incremental), since, None, 0, started_at, 'running'
+
+    def get_payroll_runs(self, period):
+        query = '''
+                SELECT run_id, period, status, incremental, last_employee_id, processed,
+                       started_at, checkpoint_at, completed_at
+                FROM payroll_runs
+                WHERE period = ?
+                ORDER BY run_id \
+                '''
+        keys = ('run_id', 'period', 'status', 'incremental', 'last_employee_id',
+                'processed', 'started_at', 'checkpoint_at', 'completed_at')
+        return [dict(zip(keys, row))
+                for row in self.db.execute_query("payroll", query, (period,))]
+
+    def run_payroll(self, period, incremental=False, chunk_size=None, progress=None,
+                    workers=None, vectorized=None, resume=True):
+        # Re-running a period is idempotent: rows are upserted on (employee_id, period)
+        # and rows of employees who are no longer eligible are removed, except the
+        # PAID_HISTORY of past periods, which is kept. A full run
+        # returns the number of employees paid for the period; an incremental run
+        # only revisits employees changed since the period was last processed and
+        # returns the number of records it inserted, updated or removed. With a
+        # chunk_size the work is staged in employee_id ranges of that size and
+        # progress(processed, total) is called after each one. With more than one
+        # worker a full run is computed by the parallel engine in payroll_engine,
+        # and with vectorized=True by the in-process vectorized engine. Each
+        # employee is paid the salary effective on the last day of the period.
+        #
+        # SQL runs are recorded in payroll_runs. Each chunk is written to
+        # payroll_staging together with a checkpoint of the last employee_id; once
+        # every chunk is staged the run is 'staged' and its rows reach
+        # payroll_records in one final transaction. A run that was interrupted is
+        # resumed from its checkpoint unless resume=False.
+        started_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        as_of = period_end(period)
+        attach = self.PAYROLL_ATTACH
+
+        run = self._unfinished_run(period) if resume else None
+        if run is None:
+            last_run = self.db.execute_single(
+                "payroll", "SELECT processed_at FROM payroll_periods WHERE period = ?",
+                (period,))
+            incremental = incremental and last_run is not None
+
+            from payroll_engine import PAYROLL_VECTORIZED, PAYROLL_WORKERS, \
+                ParallelPayrollEngine, VectorizedPayrollEngine
+            workers = PAYROLL_WORKERS if workers is None else workers
+            vectorized = PAYROLL_VECTORIZED if vectorized is None else vectorized
+            engine = None
+            if not incremental:
+                if workers > 1:
+                    engine = ParallelPayrollEngine(self, workers)
+                elif vectorized:
+                    engine = VectorizedPayrollEngine(self)
+            if engine:
+                employee_count = engine.run(period, started_at)
+                if progress:
+                    progress(employee_count, employee_count)
+                return employee_count
+
+            since = last_run[0] if incremental else None
+            run = self._start_run(period, incremental, since, started_at)
+
+        run_id, incremental, since, checkpoint, processed, started_at, status = run
+        params = {'period': period, 'as_of': as_of, 'since': since, 'run_id': run_id,
+                  'current_period': self._current_period()}
+        scope = f" AND employee_id IN ({self.CHANGED_EMPLOYEES})" if incremental else ""
+
+        count_eligible = "SELECT COUNT(*) FROM ({eligible})"
+        total = self.db.execute_single(
+            "payroll",
+            count_eligible.format(
+                eligible=self.ELIGIBLE_SALARIES.format(salary_filter=scope)),
+            params, attach=attach)[0]
+        if progress:
+            progress(processed, total)
+
+        ranges = self._payroll_ranges(chunk_size) if status == 'running' else []
+        if checkpoint is not None:
+            ranges = [(checkpoint if after is None or after < checkpoint else after,
+                       upto)
+                      for after, upto in ranges if upto is None or upto > checkpoint]
+
+        for after, upto in ranges:
+            filters = scope + self._range_filter(after, upto)
+            chunk_params = dict(params, after=after, upto=upto)
+            eligible = self.ELIGIBLE_SALARIES.format(salary_filter=filters)
+
+            with self.db.transaction("payroll", attach=attach):
+                processed += self.db.execute_rowcount("payroll", f'''
+                        INSERT INTO payroll_staging (run_id, employee_id, base_salary,
+                                                     allowances, deductions,
+                                                     net_salary, department)
+                        SELECT :run_id, employee_id, base_salary, allowances,
+                               deductions, net_salary, department
+                        FROM ({eligible}) \
+                        ''', chunk_params, attach=attach)
+                if incremental:
+                    # Changed employees who are no longer eligible are staged
+                    # as removals.
+                    self.db.execute_rowcount("payroll", f'''
+                            INSERT OR IGNORE INTO payroll_staging
+                                (run_id, employee_id, removed)
+                            SELECT :run_id, employee_id, 1
+                            FROM ({self.CHANGED_EMPLOYEES})
+                            WHERE employee_id NOT IN ({self.PAID_HISTORY})
+                              {self._range_filter(after, upto)} \
+                            ''', chunk_params, attach=attach)
+                # The checkpoint only lands while this run still owns the period;
+                # otherwise the chunk is rolled back with it.
+                owned = self.db.execute_rowcount("payroll", '''
+                        UPDATE payroll_runs
+                        SET last_employee_id = COALESCE(:upto, last_employee_id),
+                            processed        = :processed,
+                            status           = CASE WHEN :upto IS NULL THEN 'staged'
+                                                    ELSE status END,
+                            checkpoint_at    = CURRENT_TIMESTAMP
+                        WHERE run_id = :run_id
+                          AND status = 'running' \
+                        ''', {'upto': upto, 'processed': processed, 'run_id': run_id})
+                if not owned:
+                    raise PayrollRunSuperseded(
+                        f"Pay run {run_id} for {period} was superseded")
+
+            if progress:
+                progress(processed, total)
+
+        return self._complete_run(run_id, period, incremental, started_at)
+
+    def _complete_run(self, run_id, period, incremental, started_at):
+        params = {'period': period, 'run_id': run_id, 'as_of': period_end(period),
+                  'current_period': self._current_period()}
+        upsert = self.UPSERT_PAYROLL.format(source='''
+                SELECT employee_id, :period, base_salary, allowances, deductions,
+                       net_salary, department
+                FROM payroll_staging
+                WHERE run_id = :run_id
+                  AND removed = 0 ''')
+        if incremental:
+            remove = '''
+                    DELETE FROM payroll_records
+                    WHERE period = :period
+                      AND employee_id IN (SELECT employee_id FROM payroll_staging
+                                          WHERE run_id = :run_id AND removed = 1) \
+                    '''
+        else:
+            remove = f'''
+                    DELETE FROM payroll_records
+                    WHERE period = :period
+                      AND employee_id NOT IN (SELECT employee_id FROM payroll_staging
+                                              WHERE run_id = :run_id AND removed = 0)
+                      AND employee_id NOT IN ({self.PAID_HISTORY}) \
                     '''
 
-            try:
-                self.db.execute_update("payroll", query, (
-                    employee['employee_id'],
-                    period,
-                    salary['base_salary'],
-                    salary['allowances'],
-                    salary['deductions'],
-                    net_salary
-                ))
-                processed_count += 1
-            except:
-                continue
-
-        return processed_count
-
-    def generate_payslip(self, employee_id, period):
-
-        query = '''
-                SELECT * \
-                FROM payroll_records
-                WHERE employee_id = ? \
-                  AND period = ? \
+        with self.db.transaction("payroll", attach=self.PAYROLL_ATTACH):
+            owned = self.db.execute_rowcount("payroll", '''
+                    UPDATE payroll_runs
+                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+                    WHERE run_id = ?
+                      AND status = 'staged' \
+                    ''', (run_id,))
+            if not owned:
+                raise PayrollRunSuperseded(
+                    f"Pay run {run_id} for {period} was superseded")
+            changed = self.db.execute_rowcount("payroll", upsert, params)
+            changed += self.db.execute_rowcount("payroll", remove, params)
+            employee_count = self._record_period(period, started_at)
+            self.db.execute_update("payroll",
+                                   "DELETE FROM payroll_staging WHERE run_id = ?",
+                                   (run_id,))
+        return changed if incremental else employee_count
+
+    def backfill_payroll(self, start_period, end_period):
+        """Writes each period in start_period..end_period; returns {period: count}."""
+        # Employees and salary history are read once; each month is resolved
+        # against the in-memory SalaryIndex and all periods are written in a
+        # single transaction. Re-running a range is idempotent like run_payroll.
+        from payroll_engine import compute_payroll_rows
+
+        periods = period_range(start_period, end_period)
+        started_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        employee_ids = self._active_employee_ids()
+        salary_index = self.build_salary_index()
+
+        rows = []
+        for period in periods:
+            salaries = self._resolve_salaries(employee_ids, salary_index,
+                                              period_end(period))
+            for row in compute_payroll_rows(salaries):
+                rows.append((row[0], period) + row[1:])
+
+        # The attached databases make this a deferred transaction, so it must
+        # write before it reads: a read first would have to upgrade its lock
+        # and fails with "database is locked" if another connection committed
+        # in between. The upsert, or else the first DELETE, takes the lock.
+        upsert = self.UPSERT_PAYROLL.format(source=self.PAYROLL_VALUES)
+        with self.db.transaction("payroll", attach=self.PAYROLL_ATTACH):
+            if rows:
+                self.db.execute_many("payroll", upsert, rows)
+            counts = {}
+            for period in periods:
+                self._remove_ineligible({'period': period, 'as_of': period_end(period)})
+                counts[period] = self._record_period(period, started_at)
+            return counts
+
+    def process_payroll(self, period, incremental=False, workers=None, vectorized=None):
+        try:
+            return self.run_payroll(period, incremental=incremental, workers=workers,
+                                    vectorized=vectorized)
+        except Exception:
+            return 0
+
+    def preview_payroll(self, period):
+        """Streams the rows a pay run would write for period, without writing them."""
+        # Yields one 'row' item per employee with the running totals so far, then
+        # a final 'summary' item with per-department totals. Reads go through
+        # iter_query, so memory stays flat and no write lock is taken.
+        query = f'''
+                SELECT s.employee_id, e.first_name, e.last_name, e.department,
+                       e.position, s.base_salary, s.allowances, s.deductions,
+                       s.net_salary
+                FROM ({self.ELIGIBLE_SALARIES.format(salary_filter="")}) s
+                JOIN employees.employees e ON e.employee_id = s.employee_id
+                ORDER BY s.employee_id \
                 '''
-        payroll_result = self.db.execute_single("payroll", query, (employee_id, period))
+        employee_count = 0
+        total_base_salary = total_net_salary = 0.0
+        departments = {}
+
+        rows = self.db.iter_query("payroll", query, {'as_of': period_end(period)},
+                                  attach=self.PAYROLL_ATTACH)
+        for row in rows:
+            employee_count += 1
+            total_base_salary += row[5]
+            total_net_salary += row[8]
+            department = departments.setdefault(row[3], {
+                'department': row[3],
+                'employee_count': 0,
+                'total_base_salary': 0.0,
+                'total_net_salary': 0.0
+            })
+            department['employee_count'] += 1
+            department['total_base_salary'] += row[5]
+            department['total_net_salary'] += row[8]
+
+            yield {
+                'type': 'row',
+                'employee_id': row[0],
+                'first_name': row[1],
+                'last_name': row[2],
+                'department': row[3],
+                'position': row[4],
+                'base_salary': row[5],
+                'allowances': row[6],
+                'deductions': row[7],
+                'net_salary': row[8],
+                'running_employee_count': employee_count,
+                'running_total_net_salary': total_net_salary
+            }
 
-        if not payroll_result:
-            return None
+        yield {
+            'type': 'summary',
+            'period': period,
+            'employee_count': employee_count,
+            'total_base_salary': total_base_salary,
+            'total_net_salary': total_net_salary,
+            'departments': sorted(departments.values(),
+                                  key=lambda d: d['total_net_salary'], reverse=True)
+        }
 
+    PAYROLL_REPORT_COLUMNS = '''
+                p.id, p.employee_id, p.period, p.base_salary, p.allowances,
+                p.deductions, p.net_salary, COALESCE(p.payment_date, p.created_at),
+                p.status, e.first_name, e.last_name, e.department, e.position '''
 
-        from employee_manager import EmployeeManager
-        employee_manager = EmployeeManager(self.db)
-        employee = employee_manager.get_employee_by_id(employee_id)
+    def generate_payslip(self, employee_id, period):
+        query = f'''
+                SELECT {self.PAYROLL_REPORT_COLUMNS}
+                FROM payroll_records p
+                JOIN employees.employees e ON e.employee_id = p.employee_id
+                WHERE p.employee_id = ? \
+                  AND p.period = ? \
+                '''
+        return self.db.execute_single("payroll", query, (employee_id, period),
+                                      attach=("employees",),
+                                      row_factory=PayrollRecord.row_factory)
 
-        if not employee:
-            return None
+    def get_monthly_payroll_report(self, period):
+        # Cached until the period is re-run or corrected, or an employee changes.
+        return result_cache.get(self.db, ('monthly_payroll_report', period),
+                                (period, 'employees'),
+                                lambda: self._monthly_payroll_report(period))
+
+    MONTHLY_PAYROLL_REPORT = f'''
+                SELECT {PAYROLL_REPORT_COLUMNS}
+                FROM payroll_records p
+                JOIN employees.employees e ON e.employee_id = p.employee_id
+                WHERE p.period = ?
+                ORDER BY p.employee_id \
+                '''
 
+    def _monthly_payroll_report(self, period):
+        return self.db.execute_query("payroll", self.MONTHLY_PAYROLL_REPORT, (period,),
+                                     attach=("employees",),
+                                     row_factory=PayrollRecord.row_factory)
+
+    def iter_monthly_payroll_report(self, period):
+        # Streams the report straight from the cursor, bypassing the result cache.
+        return self.db.iter_query("payroll", self.MONTHLY_PAYROLL_REPORT, (period,),
+                                  attach=("employees",),
+                                  row_factory=PayrollRecord.row_factory)
+
+    PAYROLL_REPORT_SORTS = {
+        'employee_id': (('p.employee_id', 'employee_id'),),
+        'net_salary': (('p.net_salary', 'net_salary'), ('p.employee_id', 'employee_id'))
+    }
+
+    # The paged report filters on, and so shows, the department each record was
+    # paid under, which idx_payroll_period_department covers.
+    PAYROLL_PAGE_COLUMNS = PAYROLL_REPORT_COLUMNS.replace('e.department',
+                                                          'p.department')
+
+    def list_payroll_report(self, period, limit=None, cursor=None, sort='employee_id',
+                            order='asc', department=None, status=None):
+        conditions = ["p.period = ?"]
+        params = [period]
+        for condition, value in (("p.department = ?", department),
+                                 ("p.status = ?", status)):
+            if value:
+                conditions.append(condition)
+                params.append(value)
+        select = f'''
+                SELECT {self.PAYROLL_PAGE_COLUMNS}
+                FROM payroll_records p
+                JOIN employees.employees e ON e.employee_id = p.employee_id '''
+        return fetch_page(self.db, "payroll", select, conditions, params,
+                          self.PAYROLL_REPORT_SORTS, sort, order, limit, cursor,
+                          attach=("employees",), row_factory=PayrollRecord.row_factory)
+
+    def compare_periods(self, previous_period, current_period, threshold=0.0):
+        """Employees added, removed or with a net pay change above threshold."""
+        # A full outer join on employee_id, written as a LEFT JOIN plus an anti-join
+        # so both halves are driven by idx_payroll_period_employee and probe the
+        # other period through idx_payroll_employee_period.
+        query = '''
+                SELECT d.employee_id, d.change, e.first_name, e.last_name, e.department,
+                       d.previous_base_salary, d.current_base_salary,
+                       d.previous_net_salary, d.current_net_salary, d.net_delta
+                FROM (SELECT p.employee_id,
+                             CASE WHEN c.employee_id IS NULL THEN 'removed'
+                                  ELSE 'changed' END AS change,
+                             p.base_salary AS previous_base_salary,
+                             c.base_salary AS current_base_salary,
+                             p.net_salary  AS previous_net_salary,
+                             c.net_salary  AS current_net_salary,
+                             COALESCE(c.net_salary, 0) - p.net_salary AS net_delta
+                      FROM payroll_records p
+                      LEFT JOIN payroll_records c
+                             ON c.employee_id = p.employee_id
+                            AND c.period = :current_period
+                      WHERE p.period = :previous_period
+                        AND (c.employee_id IS NULL
+                             OR ABS(c.net_salary - p.net_salary) > :threshold)
+                      UNION ALL
+                      SELECT c.employee_id, 'added', NULL, c.base_salary, NULL,
+                             c.net_salary, c.net_salary
+                      FROM payroll_records c
+                      WHERE c.period = :current_period
+                        AND NOT EXISTS (SELECT 1 FROM payroll_records p
+                                        WHERE p.employee_id = c.employee_id
+                                          AND p.period = :previous_period)) d
+                LEFT JOIN employees.employees e ON e.employee_id = d.employee_id
+                ORDER BY d.employee_id \
+                '''
+        params = {'previous_period': previous_period, 'current_period': current_period,
+                  'threshold': threshold}
+        changes = self.db.execute_query("payroll", query, params, attach=("employees",),
+                                        row_factory=PayrollChange.row_factory)
 
         return {
-            'id': payroll_result[0],
-            'employee_id': payroll_result[1],
-            'period': payroll_result[2],
-            'base_salary': payroll_result[3],
-            'allowances': payroll_result[4],
-            'deductions': payroll_result[5],
-            'net_salary': payroll_result[6],
-            'payment_date': payroll_result[7] if payroll_result[7] is not None else (payroll_result[9] if len(payroll_result) > 9 else None),
-            'status': payroll_result[8],
-            'first_name': employee['first_name'],
-            'last_name': employee['last_name'],
-            'department': employee.get('department', 'N/A'),
-            'position': employee.get('position', 'N/A')
+            'previous_period': previous_period,
+            'current_period': current_period,
+            'threshold': threshold,
+            'added': sum(1 for c in changes if c.change == 'added'),
+            'removed': sum(1 for c in changes if c.change == 'removed'),
+            'changed': sum(1 for c in changes if c.change == 'changed'),
+            'net_delta': sum(c.net_delta for c in changes),
+            'changes': changes
         }
 
-    def get_monthly_payroll_report(self, period):
-        query = '''
-                SELECT * \
-                FROM payroll_records
-                WHERE period = ?
-                ORDER BY employee_id \
-                '''
-        payroll_results = self.db.execute_query("payroll", query, (period,))
-
-        from employee_manager import EmployeeManager
-        employee_manager = EmployeeManager(self.db)
-
-        records = []
-        for payroll_row in payroll_results:
-            employee_id = payroll_row[1]
-            employee = employee_manager.get_employee_by_id(employee_id)
-
-            if employee:
-                records.append({
-                    'id': payroll_row[0],
-                    'employee_id': payroll_row[1],
-                    'period': payroll_row[2],
-                    'base_salary': payroll_row[3],
-                    'allowances': payroll_row[4],
-                    'deductions': payroll_row[5],
-                    'net_salary': payroll_row[6],
-                    'payment_date': payroll_row[7] if payroll_row[7] is not None else (payroll_row[9] if len(payroll_row) > 9 else None),
-                    'status': payroll_row[8],
-                    'first_name': employee['first_name'],
-                    'last_name': employee['last_name'],
-                    'department': employee.get('department', 'N/A'),
-                    'position': employee.get('position', 'N/A')
-                })
-
-        return records
-
     def get_salary_statistics(self):
+        return result_cache.get(self.db, ('salary_statistics',), (ALL_PERIODS,),
+                                self._salary_statistics)
+
+    def _salary_statistics(self):
+        # Totals come from payroll_dept_aggregates; MIN/MAX are answered by
+        # idx_payroll_status_base without scanning payroll_records.
         query = '''
-                SELECT COUNT(*)         as total_employees, \
-                       AVG(base_salary) as avg_base_salary, \
-                       MIN(base_salary) as min_base_salary, \
-                       MAX(base_salary) as max_base_salary, \
-                       AVG(net_salary)  as avg_net_salary, \
-                       SUM(net_salary)  as total_payroll
-                FROM payroll_records
-                WHERE status = 'processed' \
+                SELECT SUM(employee_count)   as total_employees, \
+                       SUM(total_base_cents) as total_base_cents, \
+                       SUM(total_net_cents)  as total_net_cents, \
+                       (SELECT MIN(base_salary) FROM payroll_records
+                        WHERE status = 'processed') as min_base_salary, \
+                       (SELECT MAX(base_salary) FROM payroll_records
+                        WHERE status = 'processed') as max_base_salary
+                FROM payroll_dept_aggregates \
                 '''
         result = self.db.execute_single("payroll", query)
 
         if result:
+            total_employees = result[0] or 0
             return {
-                'total_employees': result[0],
-                'avg_base_salary': result[1],
-                'min_base_salary': result[2],
-                'max_base_salary': result[3],
-                'avg_net_salary': result[4],
-                'total_payroll': result[5]
+                'total_employees': total_employees,
+                'avg_base_salary': (result[1] / 100 / total_employees
+                                    if total_employees else None),
+                'min_base_salary': result[3],
+                'max_base_salary': result[4],
+                'avg_net_salary': (result[2] / 100 / total_employees
+                                   if total_employees else None),
+                'total_payroll': result[2] / 100 if total_employees else None
             }
         return None
 
     def get_department_salary_stats(self):
+        return result_cache.get(self.db, ('department_salary_stats',), (ALL_PERIODS,),
+                                self._department_salary_stats)
 
+    def _department_salary_stats(self):
+        # delete_employee clears the department of a deleted employee's
+        # records, so they are left out here as in the monthly report.
         query = '''
-                SELECT * \
-                FROM payroll_records
-                WHERE status = 'processed' \
+                SELECT department, \
+                       SUM(employee_count)   as employee_count, \
+                       SUM(total_base_cents) as total_base_cents, \
+                       SUM(total_net_cents)  as total_net_cents
+                FROM payroll_dept_aggregates
+                WHERE department != ''
+                GROUP BY department
+                ORDER BY total_net_cents DESC \
                 '''
-        payroll_results = self.db.execute_query("payroll", query)
-
-
-        from employee_manager import EmployeeManager
-        employee_manager = EmployeeManager(self.db)
-
-
-        department_stats = {}
-
-        for payroll_row in payroll_results:
-            employee_id = payroll_row[1]
-            employee = employee_manager.get_employee_by_id(employee_id)
-
-            if employee:
-                department = employee.get('department', 'Unassigned')
-                base_salary = payroll_row[3]
-                net_salary = payroll_row[6]
-
-                if department not in department_stats:
-                    department_stats[department] = {
-                        'employee_count': 0,
-                        'total_base_salary': 0,
-                        'total_net_salary': 0
-                    }
-
-                department_stats[department]['employee_count'] += 1
-                department_stats[department]['total_base_salary'] += base_salary
-                department_stats[department]['total_net_salary'] += net_salary
-
+        results = self.db.execute_query("payroll", query)
 
         stats = []
-        for department, data in department_stats.items():
+        for row in results:
             stats.append({
-                'department': department,
-                'employee_count': data['employee_count'],
-                'avg_base_salary': data['total_base_salary'] / data['employee_count'],
-                'total_department_payroll': data['total_net_salary']
+                'department': row[0],
+                'employee_count': row[1],
+                'avg_base_salary': row[2] / 100 / row[1],
+                'total_department_payroll': row[3] / 100
             })
+        return stats
+
+    def get_payroll_trend(self, start_period, end_period, department=None):
+        """Per-period headcount and net pay totals, from the department aggregates."""
+        period_range(start_period, end_period)
+        key = ('payroll_trend', start_period, end_period, department)
+        return result_cache.get(self.db, key, (ALL_PERIODS,),
+                                lambda: self._payroll_trend(start_period, end_period,
+                                                            department))
+
+    def _payroll_trend(self, start_period, end_period, department):
+        # Reads at most one aggregate row per (period, department) through the
+        # primary key, so a multi-year range never touches payroll_records.
+        query = '''
+                SELECT period, \
+                       SUM(employee_count)  as headcount, \
+                       SUM(total_base_cents) as total_base_cents, \
+                       SUM(total_net_cents) as total_net_cents, \
+                       MIN(min_net_cents)   as min_net_cents, \
+                       MAX(max_net_cents)   as max_net_cents
+                FROM payroll_dept_aggregates
+                WHERE period BETWEEN ? AND ? {department_filter}
+                GROUP BY period
+                ORDER BY period \
+                '''
+        params = [start_period, end_period]
+        department_filter = ""
+        if department is not None:
+            department_filter = "AND department = ?"
+            params.append(department)
+        results = self.db.execute_query(
+            "payroll", query.format(department_filter=department_filter), params)
+
+        return [{
+            'period': row[0],
+            'headcount': row[1],
+            'total_base_salary': row[2] / 100,
+            'total_net_salary': row[3] / 100,
+            'avg_net_salary': round(row[3] / 100 / row[1], 2),
+            'min_net_salary': row[4] / 100,
+            'max_net_salary': row[5] / 100
+        } for row in results]
+
+    DISTRIBUTION_METRICS = ('net_salary', 'base_salary')
+    DEFAULT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+    def get_salary_distribution(self, start_period, end_period, department=None,
+                                metric='net_salary', quantiles=DEFAULT_QUANTILES):
+        """Quantiles and a histogram of metric, merged from the stored sketches."""
+        period_range(start_period, end_period)
+        if metric not in self.DISTRIBUTION_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; "
+                             f"use one of {', '.join(self.DISTRIBUTION_METRICS)}")
+        quantiles = tuple(quantiles)
+        for fraction in quantiles:
+            if not 0 <= fraction <= 1:
+                raise ValueError(f"Quantile must be between 0 and 1: {fraction}")
+        key = ('salary_distribution', start_period, end_period, department, metric,
+               quantiles)
+        return result_cache.get(self.db, key, (ALL_PERIODS,),
+                                lambda: self._salary_distribution(
+                                    start_period, end_period, department, metric,
+                                    quantiles))
+
+    def _salary_distribution(self, start_period, end_period, department, metric,
+                             quantiles):
+        # Only one small sketch per (period, department) is read and merged, so
+        # a multi-year range never rescans payroll_records. Periods corrected
+        # since their last pay run are rebuilt, in memory on a read-only
+        # database, until the next write stores them.
+        built = self.refresh_salary_distributions(start_period, end_period)
+        query = '''
+                SELECT period, department, sketch, histogram
+                FROM payroll_distributions
+                WHERE period BETWEEN ? AND ? AND metric = ? \
+                '''
+        params = [start_period, end_period, metric]
+        if department is not None:
+            query += " AND department = ?"
+            params.append(department)
+
+        sketch = KLLSketch(seed=0)
+        histogram = Histogram()
+        rows = self.db.iter_query("payroll", query, params)
+        for period, row_department, stored_sketch, stored_histogram in rows:
+            if period not in built:
+                sketch.merge(KLLSketch.from_dict(json.loads(stored_sketch)))
+                histogram.merge(Histogram.from_dict(json.loads(stored_histogram)))
+        for distributions in built.values():
+            for (built_metric, built_department), parts in distributions.items():
+                if built_metric == metric and department in (None, built_department):
+                    period_sketch, period_histogram = parts
+                    sketch.merge(period_sketch)
+                    histogram.merge(period_histogram)
+
+        values = sketch.quantiles(quantiles)
+        return {
+            'department': department,
+            'metric': metric,
+            'count': sketch.count,
+            'min': sketch.min / 100 if sketch.count else None,
+            'max': sketch.max / 100 if sketch.count else None,
+            'quantiles': {f"p{fraction * 100:g}":
+                          value / 100 if value is not None else None
+                          for fraction, value in zip(quantiles, values)},
+            'histogram': [{'lower': lower / 100, 'upper': upper / 100, 'count': count}
+                          for lower, upper, count in histogram.buckets()]
+        }
 
-
-        stats.sort(key=lambda x: x['total_department_payroll'], reverse=True)
-
-        return stats
\ No newline at end of file
+    def refresh_salary_distributions(self, start_period, end_period):
+        """Rebuilds the sketches of stale periods; returns {period: sketches}."""
+        # A period is stale when its cache_versions counter, processed row
+        # count or the histogram bucket width differ from what its sketches
+        # were built from; periods with no processed rows left are dropped.
+        query = '''
+                SELECT a.period
+                FROM (SELECT period, SUM(employee_count) as row_count
+                      FROM payroll_dept_aggregates
+                      WHERE period BETWEEN :start AND :end
+                      GROUP BY period) a
+                LEFT JOIN cache_versions v ON v.scope = a.period
+                LEFT JOIN payroll_distribution_periods d ON d.period = a.period
+                WHERE d.period IS NULL
+                   OR d.source_version != COALESCE(v.version, 0)
+                   OR d.row_count != a.row_count
+                   OR d.bucket_width != :bucket_width
+                UNION ALL
+                SELECT period
+                FROM payroll_distribution_periods
+                WHERE period BETWEEN :start AND :end
+                  AND period NOT IN (SELECT period FROM payroll_dept_aggregates
+                                     WHERE period BETWEEN :start AND :end) \
+                '''
+        stale = self.db.execute_query("payroll", query,
+                                      {'start': start_period, 'end': end_period,
+                                       'bucket_width': HISTOGRAM_BUCKET_CENTS})
+        return {period: self._build_distributions(period) for period, in stale}
+
+    def _build_distributions(self, period):
+        # One streaming pass over the period feeds a sketch and a histogram per
+        # (metric, department). A read-only database only returns them.
+        distributions = {}
+        with self.db.transaction("payroll"):
+            version = self.db.execute_single(
+                "payroll", "SELECT version FROM cache_versions WHERE scope = ?",
+                (period,))
+            rows = self.db.iter_query("payroll", '''
+                SELECT COALESCE(department, ''), base_salary, net_salary
+                FROM payroll_records
+                WHERE period = ? AND status = 'processed' \
+                ''', (period,))
+            row_count = 0
+            for department, base_salary, net_salary in rows:
+                row_count += 1
+                for metric, value in (('base_salary', base_salary),
+                                      ('net_salary', net_salary)):
+                    if (metric, department) not in distributions:
+                        seed = f"{period}/{metric}/{department}"
+                        distributions[(metric, department)] = (KLLSketch(seed=seed),
+                                                               Histogram())
+                    sketch, histogram = distributions[(metric, department)]
+                    cents = to_cents(value)
+                    sketch.add(cents)
+                    histogram.add(cents)
+
+            if not self.db.read_only:
+                for table in ("payroll_distributions", "payroll_distribution_periods"):
+                    self.db.execute_update("payroll",
+                                           f"DELETE FROM {table} WHERE period = ?",
+                                           (period,))
+                if distributions:
+                    stored = [(period, metric, department,
+                               json.dumps(sketch.to_dict(), separators=(',', ':')),
+                               json.dumps(histogram.to_dict(), separators=(',', ':')))
+                              for (metric, department), (sketch, histogram)
+                              in distributions.items()]
+                    self.db.execute_many("payroll", '''
+                        INSERT INTO payroll_distributions (period, metric, department,
+                                                           sketch, histogram)
+                        VALUES (?, ?, ?, ?, ?) \
+                        ''', stored)
+                    self.db.execute_update("payroll", '''
+                        INSERT INTO payroll_distribution_periods
+                            (period, source_version, row_count, bucket_width)
+                        VALUES (?, ?, ?, ?) \
+                        ''', (period, version[0] if version else 0, row_count,
+                              HISTOGRAM_BUCKET_CENTS))
+        return distributions
@@ -0,0 +1,33 @@
+import shutil
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from database import Database, close_all_pools
+from main import app
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test against fresh databases in a temporary directory."""
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    @contextmanager
+    def api_client(self):
+        """A logged-in test client whose requests use this test's databases."""
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = 'admin'
+
+        def database(read_only=False):
+            return Database(self.db_dir, read_only=read_only)
+
+        with mock.patch('main.Database', database):
+            yield client
@@ -0,0 +1,331 @@
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from database import (ConnectionPool, Database, PoolTimeoutError, close_all_pools,
+                      get_profile_name)
+from migrations import MIGRATIONS, latest_version
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_connections_are_reused(self):
+        pool = self.db.get_pool("employees", read_only=True)
+        self.db.execute_single("employees", "SELECT COUNT(*) FROM employees")
+        self.db.execute_query("employees", "SELECT * FROM employees")
+        self.assertEqual(pool._size, 1)
+        self.assertIs(self.db.get_pool("employees"),
+                      Database(self.db_dir).get_pool("employees"))
+
+    def test_pool_is_bounded(self):
+        pool = ConnectionPool(lambda: self.db.get_connection("admin"), max_size=1,
+                              timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+
+    def test_broken_connection_is_replaced(self):
+        pool = ConnectionPool(lambda: self.db.get_connection("admin"), max_size=1,
+                              health_check_interval=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.close()
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(replacement.execute("SELECT 1").fetchone(), (1,))
+
+    def test_failed_write_is_rolled_back(self):
+        insert = "INSERT INTO admins (username, password) VALUES (?, ?)"
+        self.db.execute_update("admin", insert, ('alice', 'secret'))
+        with self.assertRaises(Exception):
+            self.db.execute_update("admin", insert, ('alice', 'other'))
+        count = self.db.execute_single(
+            "admin", "SELECT COUNT(*) FROM admins WHERE username = 'alice'")
+        self.assertEqual(count[0], 1)
+
+    def test_concurrent_access(self):
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(20):
+                    self.db.execute_update(
+                        "admin",
+                        "INSERT INTO admins (username, password) VALUES (?, ?)",
+                        (f"user-{n}-{i}", 'pw'))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        count = self.db.execute_single(
+            "admin", "SELECT COUNT(*) FROM admins WHERE username LIKE 'user-%'")
+        self.assertEqual(count[0], 80)
+
+    def test_attached_query(self):
+        self.db.execute_update("payroll",
+                               "INSERT INTO payroll_records (employee_id, period, "
+                               "base_salary, net_salary) "
+                               "VALUES ('E1', '2024-01', 100, 100)")
+        self.db.execute_update("employees",
+                               "INSERT INTO employees (employee_id, first_name, "
+                               "last_name, email, department, position, hire_date) "
+                               "VALUES ('E1', 'Ann', 'Lee', 'ann@example.com', 'IT', "
+                               "'Dev', '2024-01-01')")
+        row = self.db.execute_single("payroll", "SELECT e.first_name, p.net_salary "
+                                     "FROM payroll_records p "
+                                     "JOIN employees.employees e USING (employee_id)",
+                                     attach=("employees",))
+        self.assertEqual(row, ('Ann', 100))
+        with self.assertRaises(ValueError):
+            self.db.execute_single("payroll", "SELECT 1", attach=("main",))
+
+
+class TestTransactions(unittest.TestCase):
+    INSERT_ADMIN = "INSERT INTO admins (username, password) VALUES (?, ?)"
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def count_admins(self):
+        return self.db.execute_single("admin", "SELECT COUNT(*) FROM admins")[0]
+
+    def test_execute_many_commits_once(self):
+        rows = [(f"user{i}", 'pw') for i in range(500)]
+        self.assertEqual(self.db.execute_many("admin", self.INSERT_ADMIN, rows), 500)
+        self.assertEqual(self.count_admins(), 501)
+
+    def test_transaction_commits_on_success(self):
+        with self.db.transaction("admin"):
+            self.db.execute_update("admin", self.INSERT_ADMIN, ('alice', 'pw'))
+            self.db.execute_many("admin", self.INSERT_ADMIN,
+                                 [('bob', 'pw'), ('carol', 'pw')])
+            with self.db.transaction("admin"):
+                self.db.execute_update("admin", self.INSERT_ADMIN, ('dave', 'pw'))
+            self.assertEqual(self.count_admins(), 5)
+        self.assertEqual(self.count_admins(), 5)
+
+    def test_transaction_rolls_back_on_failure(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.db.transaction("admin"):
+                self.db.execute_update("admin", self.INSERT_ADMIN, ('alice', 'pw'))
+                self.db.execute_update("admin", self.INSERT_ADMIN, ('alice', 'pw'))
+        self.assertEqual(self.count_admins(), 1)
+
+    def test_transaction_requires_matching_attachments(self):
+        with self.db.transaction("payroll"):
+            with self.assertRaises(ValueError):
+                self.db.execute_query("payroll", "SELECT 1", attach=("employees",))
+
+
+class TestReadOnlyConnections(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_selects_use_read_only_connections(self):
+        self.db.execute_query("admin", "SELECT * FROM admins")
+        self.assertEqual(self.db.get_pool("admin", read_only=True)._size, 1)
+        self.assertEqual(self.db.get_pool("admin")._size, 0)
+        self.assertEqual(self.db.execute_single("admin", "PRAGMA query_only")[0], 0)
+
+    def test_read_only_database_rejects_writes(self):
+        reader = Database(self.db_dir, read_only=True)
+        self.assertEqual(
+            reader.execute_single("admin", "SELECT COUNT(*) FROM admins")[0], 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute_update(
+                "admin", "INSERT INTO admins (username, password) VALUES ('x', 'y')")
+
+    def test_reads_are_not_blocked_by_a_running_write(self):
+        reader = Database(self.db_dir, read_only=True)
+        with self.db.transaction("admin"):
+            self.db.execute_update(
+                "admin", "INSERT INTO admins (username, password) VALUES ('x', 'y')")
+            count = reader.execute_single("admin", "SELECT COUNT(*) FROM admins")[0]
+        self.assertEqual(count, 1)
+
+    def test_iter_query_streams_and_releases_connection(self):
+        self.db.execute_many("admin",
+                             "INSERT INTO admins (username, password) VALUES (?, 'x')",
+                             [(f"user{i}",) for i in range(25)])
+        rows = self.db.iter_query("admin", "SELECT username FROM admins ORDER BY id",
+                                  batch_size=10)
+
+        self.assertEqual(next(rows), ('admin',))
+        pool = self.db.get_pool("admin", read_only=True)
+        self.assertEqual(len(pool._idle), 0)
+        self.assertEqual(len(list(rows)), 25)
+        self.assertEqual(len(pool._idle), 1)
+
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_schema_is_created_once_per_process(self):
+        db = Database(self.db_dir)
+        version = db.execute_single("payroll",
+                                    "SELECT MAX(version) FROM schema_version")[0]
+        self.assertEqual(version, latest_version("payroll"))
+
+        with mock.patch.object(Database, 'init_databases') as init:
+            Database(self.db_dir)
+            Database(self.db_dir)
+        init.assert_not_called()
+
+    def test_stored_version_skips_schema_work(self):
+        db = Database(self.db_dir)
+        db.execute_update("admin", "DELETE FROM admins WHERE username = 'admin'")
+
+        with mock.patch.object(Database, 'init_admin_db') as init_admin:
+            db.init_databases()
+        init_admin.assert_not_called()
+        self.assertIsNone(db.execute_single(
+            "admin", "SELECT * FROM admins WHERE username = 'admin'"))
+
+
+class TestPerformanceProfile(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_profile_is_applied_to_connections(self):
+        db = Database(self.db_dir, profile='bulk')
+        self.assertEqual(db.execute_single("salary", "PRAGMA journal_mode")[0], 'wal')
+        self.assertEqual(db.execute_single("salary", "PRAGMA synchronous")[0], 0)
+        self.assertEqual(db.execute_single("salary", "PRAGMA busy_timeout")[0], 30000)
+        self.assertEqual(db.execute_single("salary", "PRAGMA temp_store")[0], 2)
+
+    def test_profile_from_environment(self):
+        with mock.patch.dict('os.environ', {'PAYROLL_DB_PROFILE': 'durable'}):
+            self.assertEqual(get_profile_name(), 'durable')
+            self.assertEqual(get_profile_name('bulk'), 'bulk')
+        with self.assertRaises(ValueError):
+            get_profile_name('turbo')
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_existing_database_is_upgraded_in_place(self):
+        conn = sqlite3.connect(f"{self.db_dir}/salary.db")
+        Database.init_salary_db(None, conn)
+        conn.execute("INSERT INTO salaries (employee_id, base_salary, effective_date) "
+                     "VALUES ('E1', 1000, '2024-01-01')")
+        conn.commit()
+        conn.close()
+
+        db = Database(self.db_dir)
+        indexes = {row[0] for row in db.execute_query(
+            "salary", "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('idx_salaries_employee_effective', indexes)
+        self.assertEqual(
+            db.execute_single("salary", "SELECT COUNT(*) FROM salaries")[0], 1)
+        versions = [row[0] for row in db.execute_query(
+            "salary", "SELECT version FROM schema_version ORDER BY version")]
+        self.assertEqual(versions, [1] + [step[0] for step in MIGRATIONS["salary"]])
+
+    def test_duplicate_payroll_records_are_collapsed(self):
+        conn = sqlite3.connect(f"{self.db_dir}/payroll.db")
+        Database.init_payroll_db(None, conn)
+        for net in (100, 200):
+            conn.execute("INSERT INTO payroll_records (employee_id, period, "
+                         "base_salary, net_salary) VALUES ('E1', '2024-01', ?, ?)",
+                         (net, net))
+        conn.commit()
+        conn.close()
+
+        db = Database(self.db_dir)
+        rows = db.execute_query("payroll", "SELECT employee_id, period, net_salary "
+                                           "FROM payroll_records")
+        self.assertEqual(rows, [('E1', '2024-01', 200)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.execute_update("payroll",
+                              "INSERT INTO payroll_records (employee_id, period, "
+                              "base_salary, net_salary) VALUES ('E1', '2024-01', 1, 1)")
+
+    def test_payroll_aggregates_are_built_from_existing_records(self):
+        conn = sqlite3.connect(f"{self.db_dir}/employees.db")
+        Database.init_employee_db(None, conn)
+        conn.execute("INSERT INTO employees (employee_id, first_name, last_name, "
+                     "email, department, position, hire_date) "
+                     "VALUES ('E1', 'A', 'B', 'a@example.com', 'Sales', 'Rep', "
+                     "'2023-01-01')")
+        conn.commit()
+        conn.close()
+        conn = sqlite3.connect(f"{self.db_dir}/payroll.db")
+        Database.init_payroll_db(None, conn)
+        for period in ('2024-01', '2024-02'):
+            conn.execute("INSERT INTO payroll_records (employee_id, period, "
+                         "base_salary, net_salary) "
+                         "VALUES ('E1', ?, 1000.10, 900.05)", (period,))
+        conn.commit()
+        conn.close()
+
+        db = Database(self.db_dir)
+        self.assertEqual(db.execute_query(
+            "payroll", "SELECT DISTINCT department FROM payroll_records"),
+            [('Sales',)])
+        self.assertEqual(db.execute_query(
+            "payroll", "SELECT * FROM payroll_dept_aggregates ORDER BY period"),
+                         [('2024-01', 'Sales', 1, 100010, 90005, 90005, 90005),
+                          ('2024-02', 'Sales', 1, 100010, 90005, 90005, 90005)])
+
+    def test_hot_path_queries_use_indexes(self):
+        db = Database(self.db_dir)
+        plan = db.execute_query("salary", "EXPLAIN QUERY PLAN SELECT * FROM salaries "
+                                "WHERE employee_id = ? "
+                                "ORDER BY effective_date DESC LIMIT 1", ('E1',))
+        self.assertIn('idx_salaries_employee_effective',
+                      ' '.join(row[3] for row in plan))
+        plan = db.execute_query("payroll", "EXPLAIN QUERY PLAN "
+                                "SELECT * FROM payroll_records "
+                                "WHERE period = ? ORDER BY employee_id", ('2024-01',))
+        self.assertIn('idx_payroll_period_employee', ' '.join(row[3] for row in plan))
+        plan = db.execute_query("payroll", "EXPLAIN QUERY PLAN "
+                                "SELECT MIN(base_salary) FROM payroll_records "
+                                "WHERE status = 'processed'")
+        self.assertIn('idx_payroll_status_base', ' '.join(row[3] for row in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
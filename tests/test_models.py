@@ -0,0 +1,48 @@
+import json
+import unittest
+
+from main import app
+from models import Employee, PayrollRecord
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.employee = Employee(1, 'abc12345', 'Ann', 'Lee', 'ann@example.com',
+                                 '555-0100', 'IT', 'Developer', '2024-01-01', 'active',
+                                 '2024-01-01 09:00:00')
+
+    def test_dict_style_access(self):
+        self.assertEqual(self.employee['first_name'], 'Ann')
+        self.assertEqual(self.employee.get('department', 'N/A'), 'IT')
+        self.assertEqual(self.employee.get('missing', 'N/A'), 'N/A')
+        with self.assertRaises(KeyError):
+            self.employee['missing']
+        self.assertFalse(hasattr(self.employee, '__dict__'))
+
+    def test_json_shape_matches_legacy_dicts(self):
+        payload = json.loads(app.json.dumps([self.employee]))
+        self.assertEqual(payload, [{
+            'id': 1,
+            'employee_id': 'abc12345',
+            'first_name': 'Ann',
+            'last_name': 'Lee',
+            'email': 'ann@example.com',
+            'phone': '555-0100',
+            'department': 'IT',
+            'position': 'Developer',
+            'hire_date': '2024-01-01',
+            'status': 'active',
+            'created_at': '2024-01-01 09:00:00'
+        }])
+        self.assertEqual(dict(self.employee), self.employee.to_dict())
+
+    def test_row_factory(self):
+        row = (7, 'abc12345', '2024-01', 100.0, 10.0, 5.0, 105.0, '2024-02-01',
+               'processed', 'Ann', 'Lee', 'IT', 'Developer')
+        record = PayrollRecord.row_factory(None, row)
+        self.assertEqual(record.net_salary, 105.0)
+        self.assertEqual(list(record.keys())[-1], 'position')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+
+from employee_manager import EmployeeManager
+from pagination import encode_cursor
+from salary_manager import SalaryManager
+from tests.base import DatabaseTestCase
+
+
+class TestKeysetPagination(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee_manager = EmployeeManager(self.db)
+        self.salary_manager = SalaryManager(self.db)
+
+        self.employee_manager.add_employees([{
+            'first_name': f"First{i % 4}",
+            'last_name': f"Last{i % 5}",
+            'email': f"employee{i}@example.com",
+            'phone': '',
+            'department': 'Sales' if i % 3 else 'Ops',
+            'position': 'Staff',
+            'hire_date': f"2023-{i % 12 + 1:02d}-01",
+            'status': 'inactive' if i % 10 == 0 else 'active'
+        } for i in range(30)])
+        self.employees = self.employee_manager.get_all_employees()
+
+    def walk(self, fetch, **kwargs):
+        items, cursor, pages = [], None, 0
+        while True:
+            page = fetch(limit=7, cursor=cursor, **kwargs)
+            items.extend(page['items'])
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                return items, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        items, pages = self.walk(self.employee_manager.list_employees)
+
+        self.assertEqual(pages, 5)
+        expected = sorted(self.employees,
+                          key=lambda e: (e.last_name, e.first_name, e.employee_id))
+        self.assertEqual([e.employee_id for e in items],
+                         [e.employee_id for e in expected])
+
+    def test_filters_and_descending_sort(self):
+        items, _ = self.walk(self.employee_manager.list_employees, sort='hire_date',
+                             order='desc', department='Sales', status='active',
+                             hired_from='2023-03-01', hired_to='2023-09-01')
+
+        expected = sorted((e for e in self.employees
+                           if e.department == 'Sales' and e.status == 'active'
+                           and '2023-03-01' <= e.hire_date <= '2023-09-01'),
+                          key=lambda e: (e.hire_date, e.employee_id), reverse=True)
+        self.assertTrue(expected)
+        self.assertEqual([e.employee_id for e in items],
+                         [e.employee_id for e in expected])
+
+    def test_invalid_requests(self):
+        with self.assertRaises(ValueError):
+            self.employee_manager.list_employees(sort='email')
+        cursor = self.employee_manager.list_employees(limit=2)['next_cursor']
+        with self.assertRaises(ValueError):
+            self.employee_manager.list_employees(sort='hire_date', cursor=cursor)
+        with self.assertRaises(ValueError):
+            self.employee_manager.list_employees(cursor='not-a-cursor')
+        for values in (['Last1', ['First1'], 'E001'], ['Last1', 'First1', {}]):
+            with self.assertRaises(ValueError):
+                self.employee_manager.list_employees(
+                    cursor=encode_cursor('name:asc', values))
+
+    def test_payroll_report_and_salary_history_pages(self):
+        self.salary_manager.set_salaries([{'employee_id': e.employee_id,
+                                           'base_salary': 1000.0 + i % 3,
+                                           'allowances': 0.0, 'deductions': 0.0,
+                                           'effective_date': '2024-01-01'}
+                                          for i, e in enumerate(self.employees)])
+        self.salary_manager.process_payroll('2024-01')
+
+        items, _ = self.walk(self.salary_manager.list_payroll_report, period='2024-01',
+                             sort='net_salary')
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual([(r.net_salary, r.employee_id) for r in items],
+                         sorted((r.net_salary, r.employee_id) for r in report))
+
+        # A move after the pay run leaves the record under the old department.
+        moved = next(e for e in self.employees
+                     if e.department == 'Ops' and e.status == 'active')
+        self.employee_manager.update_employee(moved.employee_id,
+                                              {'department': 'Sales'})
+        items, _ = self.walk(self.salary_manager.list_payroll_report, period='2024-01',
+                             department='Ops')
+        self.assertIn(moved.employee_id, [r.employee_id for r in items])
+        self.assertEqual({r.department for r in items}, {'Ops'})
+
+        employee_id = self.employees[0].employee_id
+        for base_salary in (1100.0, 1200.0, 1300.0):
+            self.salary_manager.set_salary({'employee_id': employee_id,
+                                            'base_salary': base_salary,
+                                            'allowances': 0.0, 'deductions': 0.0,
+                                            'effective_date': '2024-06-01'})
+        first = self.salary_manager.list_salary_history(employee_id, limit=2)
+        second = self.salary_manager.list_salary_history(employee_id, limit=2,
+                                                         cursor=first['next_cursor'])
+        self.assertEqual([s.base_salary for s in first['items'] + second['items']],
+                         [1300.0, 1200.0, 1100.0, 1000.0])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_api(self):
+        with self.api_client() as client:
+            page = client.get('/api/employees?limit=5&department=Ops').get_json()
+            self.assertEqual(len(page['items']), 5)
+            rest = client.get(f"/api/employees?limit=5&department=Ops"
+                              f"&cursor={page['next_cursor']}").get_json()
+            self.assertEqual(len(page['items'] + rest['items']), 10)
+            self.assertIsNone(rest['next_cursor'])
+            self.assertEqual(client.get('/api/employees?sort=email').status_code, 400)
+            self.assertEqual(client.get('/api/employees?limit=abc').status_code, 400)
+            self.assertEqual(len(client.get('/api/employees').get_json()), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
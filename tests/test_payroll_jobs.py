@@ -0,0 +1,120 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from database import Database, close_all_pools
+from main import app
+from payroll_jobs import PayrollJobManager
+from salary_manager import SalaryManager
+
+
+class TestPayrollJobs(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+        self.jobs = PayrollJobManager(lambda: Database(self.db_dir), max_workers=1,
+                                      chunk_size=3)
+
+        for i in range(10):
+            employee_id = f"E{i:03d}"
+            self.db.execute_update(
+                "employees", "INSERT INTO employees (employee_id, first_name, "
+                             "last_name, email, department, position, hire_date) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (employee_id, 'First', f"Last{i}", f"e{i}@example.com", 'Ops', 'Staff',
+                 '2023-01-01'))
+            self.db.execute_update(
+                "salary", "INSERT INTO salaries (employee_id, base_salary, allowances, "
+                          "deductions, effective_date) "
+                          "VALUES (?, 1000, 0, 0, '2024-01-01')",
+                (employee_id,))
+
+    def tearDown(self):
+        self.jobs.shutdown()
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_job_reports_progress_and_result(self):
+        job_id = self.jobs.submit('2024-05')
+        job = self.jobs.wait(job_id, timeout=10)
+
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['result'], 10)
+        self.assertEqual((job['processed'], job['total']), (10, 10))
+        self.assertEqual(job['errors'], [])
+        self.assertGreaterEqual(job['elapsed'], 0.0)
+        report = SalaryManager(self.db).get_monthly_payroll_report('2024-05')
+        self.assertEqual(len(report), 10)
+
+    def test_failed_job_records_error(self):
+        with mock.patch.object(SalaryManager, 'run_payroll',
+                               side_effect=RuntimeError('disk full')):
+            job = self.jobs.wait(self.jobs.submit('2024-05'), timeout=10)
+
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['errors'], ['disk full'])
+
+    def test_one_job_per_period_at_a_time(self):
+        started, release = threading.Event(), threading.Event()
+
+        def run_payroll(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return 10
+
+        with mock.patch.object(SalaryManager, 'run_payroll', side_effect=run_payroll):
+            job_id = self.jobs.submit('2024-05')
+            started.wait(10)
+            self.assertEqual(self.jobs.submit('2024-05'), job_id)
+            release.set()
+            self.jobs.wait(job_id, timeout=10)
+
+        self.assertNotEqual(self.jobs.submit('2024-05'), job_id)
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.jobs.get('missing'))
+
+    def test_api_enqueues_and_reports_job(self):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = 'admin'
+
+        with mock.patch('main.payroll_jobs', self.jobs):
+            res = client.post('/api/payroll/process', json={'period': '2024-06'})
+            self.assertEqual(res.status_code, 202)
+            job_id = res.get_json()['job_id']
+            self.jobs.wait(job_id, timeout=10)
+
+            job = client.get(f'/api/payroll/jobs/{job_id}').get_json()
+            self.assertEqual(job['status'], 'completed')
+            self.assertEqual(job['result'], 10)
+            self.assertEqual(client.get('/api/payroll/jobs/missing').status_code, 404)
+
+            res = client.post('/api/payroll/process',
+                              json={'period': '2024-06', 'incremental': 'maybe'})
+            self.assertEqual(res.status_code, 400)
+
+    def test_api_runs_in_the_request_when_serverless(self):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = 'admin'
+
+        jobs = PayrollJobManager(lambda: Database(self.db_dir), max_workers=1,
+                                 synchronous=True)
+        self.addCleanup(jobs.shutdown)
+        with mock.patch('main.payroll_jobs', jobs), \
+                mock.patch.object(SalaryManager, 'run_payroll',
+                                  return_value=10) as run_payroll:
+            res = client.post('/api/payroll/process',
+                              json={'period': '2024-06', 'incremental': 'false'})
+
+        self.assertEqual(res.status_code, 200)
+        job = res.get_json()['job']
+        self.assertEqual((job['status'], job['result']), ('completed', 10))
+        self.assertIs(run_payroll.call_args.kwargs['incremental'], False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+from bisect import bisect_right
+
+from quantile_sketch import Histogram, KLLSketch
+
+
+class TestKLLSketch(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.randint(100000, 900000) for _ in range(50000)]
+        self.sorted_values = sorted(self.values)
+
+    def rank_error(self, sketch, fraction):
+        rank = bisect_right(self.sorted_values, sketch.quantile(fraction))
+        return abs(rank / len(self.values) - fraction)
+
+    def test_small_streams_are_exact(self):
+        sketch = KLLSketch(seed=1)
+        for value in [5, 1, 4, 2, 3]:
+            sketch.add(value)
+        self.assertEqual(sketch.quantiles([0, 0.5, 1]), [1, 3, 5])
+        self.assertEqual(KLLSketch().quantile(0.5), None)
+        with self.assertRaises(ValueError):
+            sketch.quantile(1.5)
+
+    def test_rank_error_and_bounded_memory(self):
+        sketch = KLLSketch(k=200, seed=1)
+        for value in self.values:
+            sketch.add(value)
+
+        self.assertEqual((sketch.count, sketch.min, sketch.max),
+                         (50000, self.sorted_values[0], self.sorted_values[-1]))
+        self.assertLess(sum(len(items) for items in sketch.to_dict()['levels']), 1000)
+        for fraction in (0.01, 0.25, 0.5, 0.9, 0.99):
+            self.assertLess(self.rank_error(sketch, fraction), 0.02)
+
+    def test_merged_serialized_parts_match_one_stream(self):
+        parts = [KLLSketch(seed=part) for part in range(12)]
+        for i, value in enumerate(self.values):
+            parts[i % 12].add(value)
+
+        merged = KLLSketch(seed=0)
+        for part in parts:
+            merged.merge(KLLSketch.from_dict(part.to_dict()))
+        self.assertEqual(merged.count, 50000)
+        for fraction in (0.1, 0.5, 0.9):
+            self.assertLess(self.rank_error(merged, fraction), 0.02)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_fixed_buckets_merge(self):
+        first, second = Histogram(100), Histogram(100)
+        for value in (0, 99, 100, 250):
+            first.add(value)
+        second.add(120)
+
+        merged = Histogram.from_dict(first.to_dict()).merge(second)
+        self.assertEqual(merged.buckets(), [(0, 100, 2), (100, 200, 2), (200, 300, 1)])
+        with self.assertRaises(ValueError):
+            merged.merge(Histogram(50))
+
+
+if __name__ == '__main__':
+    unittest.main()
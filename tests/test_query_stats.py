@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+import unittest
+
+from database import Database, close_all_pools
+from main import app
+from query_stats import query_stats
+
+
+class TestQueryStats(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+        query_stats.reset()
+        query_stats.enable(slow_query_ms=100.0)
+
+    def tearDown(self):
+        query_stats.disable()
+        query_stats.reset()
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_statements_are_aggregated(self):
+        for _ in range(3):
+            self.db.execute_query("admin", "SELECT   username\n FROM admins")
+        self.db.execute_single("admin", "SELECT COUNT(*) FROM admins")
+
+        stats = {s['query']: s for s in self.db.get_query_stats()}
+        entry = stats['SELECT username FROM admins']
+        self.assertEqual(entry['database'], 'admin')
+        self.assertEqual(entry['count'], 3)
+        self.assertEqual(entry['rows'], 3)
+        self.assertGreaterEqual(entry['max_ms'], entry['avg_ms'])
+        self.assertEqual(stats['SELECT COUNT(*) FROM admins']['rows'], 1)
+
+    def test_slow_queries_are_logged_with_plan(self):
+        query_stats.enable(slow_query_ms=0)
+        with self.assertLogs('query_stats', level='WARNING') as logs:
+            self.db.execute_query("admin", "SELECT * FROM admins WHERE username = ?",
+                                  ('admin',))
+        self.assertIn('plan:', logs.output[0])
+
+    def test_disabled_by_default_records_nothing(self):
+        query_stats.disable()
+        self.db.execute_query("admin", "SELECT * FROM admins")
+        self.assertEqual(self.db.get_query_stats(), [])
+
+    def test_api_requires_admin(self):
+        client = app.test_client()
+        self.assertEqual(client.get('/api/admin/query-stats').status_code, 401)
+
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = 'admin'
+        self.db.execute_query("admin", "SELECT * FROM admins")
+        payload = client.get('/api/admin/query-stats').get_json()
+        self.assertTrue(payload['enabled'])
+        self.assertEqual(payload['queries'][0]['query'], 'SELECT * FROM admins')
+        self.assertEqual(client.delete('/api/admin/query-stats').status_code, 200)
+        self.assertEqual(query_stats.snapshot(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from database import Database, close_all_pools
+from employee_manager import EmployeeManager
+from result_cache import ResultCache, result_cache
+from salary_manager import SalaryManager
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_dir)
+        self.employee_manager = EmployeeManager(self.db)
+        self.salary_manager = SalaryManager(self.db)
+
+        self.employee_manager.add_employee({
+            'first_name': 'Alice',
+            'last_name': 'Anders',
+            'email': 'alice@example.com',
+            'phone': '',
+            'department': 'Engineering',
+            'position': 'Staff',
+            'hire_date': '2023-01-01',
+            'status': 'active'
+        })
+        self.alice = self.employee_manager.get_all_employees()[0]['employee_id']
+        self.salary_manager.set_salary({'employee_id': self.alice,
+                                        'base_salary': 5000.0,
+                                        'allowances': 0.0, 'deductions': 0.0,
+                                        'effective_date': '2024-01-01'})
+        self.salary_manager.process_payroll('2024-01')
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def count_calls(self, method):
+        return mock.patch.object(SalaryManager, method, autospec=True,
+                                 side_effect=getattr(SalaryManager, method))
+
+    def total_payroll(self):
+        return self.salary_manager.get_salary_statistics()['total_payroll']
+
+    def report(self, period='2024-01'):
+        return self.salary_manager.get_monthly_payroll_report(period)
+
+    def test_repeat_reads_are_served_from_memory(self):
+        with self.count_calls('_salary_statistics') as stats, \
+                self.count_calls('_monthly_payroll_report') as report:
+            for _ in range(3):
+                self.assertEqual(self.total_payroll(), 5000.0)
+                self.assertEqual(len(self.report()), 1)
+
+        self.assertEqual((stats.call_count, report.call_count), (1, 1))
+
+    def test_pay_run_only_evicts_its_period(self):
+        self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.salary_manager.get_salary_statistics()
+        self.salary_manager.process_payroll('2024-02')
+
+        with self.count_calls('_salary_statistics') as stats, \
+                self.count_calls('_monthly_payroll_report') as report:
+            self.assertEqual(self.total_payroll(), 10000.0)
+            self.salary_manager.get_monthly_payroll_report('2024-01')
+
+        self.assertEqual((stats.call_count, report.call_count), (1, 0))
+
+    def test_writes_from_other_connections_invalidate(self):
+        self.assertEqual(self.report()[0]['net_salary'], 5000.0)
+
+        conn = sqlite3.connect(f"{self.db_dir}/payroll.db")
+        conn.execute("UPDATE payroll_records SET net_salary = 4500.0")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.report()[0]['net_salary'], 4500.0)
+
+        self.assertEqual(self.total_payroll(), 4500.0)
+        conn = sqlite3.connect(f"{self.db_dir}/payroll.db")
+        conn.execute("INSERT INTO payroll_records (employee_id, period, base_salary, "
+                     "net_salary) VALUES ('E2', '2024-01', 100.0, 100.0)")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.total_payroll(), 4600.0)
+        with self.count_calls('_monthly_payroll_report') as report:
+            self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual(report.call_count, 1)
+
+        self.employee_manager.update_employee(self.alice, {'first_name': 'Alicia'})
+        self.assertEqual(self.report()[0]['first_name'], 'Alicia')
+
+    def test_lru_eviction_and_memory_cap(self):
+        cache = ResultCache(max_entries=2, max_bytes=10000)
+        cache.get(self.db, ('a',), (), lambda: 1)
+        cache.get(self.db, ('b',), (), lambda: 2)
+        cache.get(self.db, ('a',), (), lambda: 1)
+        cache.get(self.db, ('c',), (), lambda: 3)
+
+        self.assertEqual(cache.get(self.db, ('a',), (), lambda: 'recomputed'), 1)
+        self.assertEqual(cache.get(self.db, ('b',), (), lambda: 'recomputed'),
+                         'recomputed')
+
+        cache.get(self.db, ('big',), (), lambda: ['x' * 100] * 200)
+        self.assertLessEqual(cache.stats()['bytes'], 10000)
+        self.assertEqual(cache.get(self.db, ('big',), (), lambda: 'recomputed'),
+                         'recomputed')
+        cache.clear()
+
+    def test_disabled_cache_always_computes(self):
+        with mock.patch.object(result_cache, 'enabled', False), \
+                self.count_calls('_salary_statistics') as stats:
+            self.salary_manager.get_salary_statistics()
+            self.salary_manager.get_salary_statistics()
+        self.assertEqual(stats.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,757 @@
+import json
+import os
+import sqlite3
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import payroll_engine
+
+from database import Database
+from employee_manager import EmployeeManager
+from salary_manager import PayrollRunSuperseded, SalaryManager
+from tests.base import DatabaseTestCase
+
+
+class SalaryManagerTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee_manager = EmployeeManager(self.db)
+        self.salary_manager = SalaryManager(self.db)
+
+    def add_employee(self, first_name, last_name, department, status='active'):
+        self.employee_manager.add_employee({
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f"{first_name.lower()}.{last_name.lower()}@example.com",
+            'phone': '555-0100',
+            'department': department,
+            'position': 'Staff',
+            'hire_date': '2023-01-01',
+            'status': status
+        })
+        return next(e['employee_id'] for e in self.employee_manager.get_all_employees()
+                    if e['first_name'] == first_name and e['last_name'] == last_name)
+
+    def set_salary(self, employee_id, base_salary, allowances=0.0, deductions=0.0,
+                   effective_date='2024-01-01'):
+        self.salary_manager.set_salary({
+            'employee_id': employee_id,
+            'base_salary': base_salary,
+            'allowances': allowances,
+            'deductions': deductions,
+            'effective_date': effective_date
+        })
+
+
+class TestPayrollReports(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.bob = self.add_employee('Bob', 'Brown', 'Engineering')
+        self.carol = self.add_employee('Carol', 'Clark', 'Sales')
+        self.set_salary(self.alice, 6000.0, 500.0, 300.0)
+        self.set_salary(self.bob, 4000.0, 0.0, 100.0)
+        self.set_salary(self.carol, 5000.0, 200.0, 0.0)
+        self.salary_manager.process_payroll('2024-01')
+
+    def test_monthly_report_joins_employee_details(self):
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+
+        self.assertEqual(len(report), 3)
+        self.assertEqual([r['employee_id'] for r in report],
+                         sorted([self.alice, self.bob, self.carol]))
+        alice = next(r for r in report if r['employee_id'] == self.alice)
+        self.assertEqual(alice['first_name'], 'Alice')
+        self.assertEqual(alice['department'], 'Engineering')
+        self.assertEqual(alice['net_salary'], 6200.0)
+        self.assertIsNotNone(alice['payment_date'])
+
+    def test_department_stats(self):
+        stats = self.salary_manager.get_department_salary_stats()
+
+        self.assertEqual([s['department'] for s in stats], ['Engineering', 'Sales'])
+        self.assertEqual(stats[0]['employee_count'], 2)
+        self.assertEqual(stats[0]['avg_base_salary'], 5000.0)
+        self.assertEqual(stats[0]['total_department_payroll'], 6200.0 + 3900.0)
+
+    def test_department_stats_skip_records_of_deleted_employees(self):
+        self.db.execute_update("payroll", "INSERT INTO payroll_records (employee_id, "
+                                          "period, base_salary, net_salary) "
+                                          "VALUES ('GONE', '2024-01', 1000.0, 1000.0)")
+
+        stats = self.salary_manager.get_department_salary_stats()
+        self.assertEqual([s['department'] for s in stats], ['Engineering', 'Sales'])
+
+    def test_deleting_an_employee_drops_them_from_department_stats(self):
+        self.assertEqual(len(self.salary_manager.get_department_salary_stats()), 2)
+        self.assertTrue(self.employee_manager.delete_employee(self.bob))
+
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual([r['employee_id'] for r in report],
+                         sorted([self.alice, self.carol]))
+        stats = self.salary_manager.get_department_salary_stats()
+        self.assertEqual([(s['department'], s['employee_count'],
+                           s['total_department_payroll']) for s in stats],
+                         [('Engineering', 1, 6200.0), ('Sales', 1, 5200.0)])
+
+    def test_aggregates_follow_corrections_and_keep_department_snapshot(self):
+        self.db.execute_update("payroll", "UPDATE payroll_records "
+                                          "SET net_salary = 4000.0 "
+                                          "WHERE employee_id = ?", (self.bob,))
+        self.employee_manager.update_employee(self.carol, {'department': 'Marketing'})
+        self.db.execute_update("payroll", "DELETE FROM payroll_records "
+                                          "WHERE employee_id = ?", (self.alice,))
+
+        stats = self.salary_manager.get_department_salary_stats()
+        self.assertEqual([(s['department'], s['employee_count'],
+                           s['total_department_payroll']) for s in stats],
+                         [('Sales', 1, 5200.0), ('Engineering', 1, 4000.0)])
+        statistics = self.salary_manager.get_salary_statistics()
+        self.assertEqual(statistics['total_payroll'], 9200.0)
+
+        self.db.execute_update("payroll", "UPDATE payroll_records SET status = 'void' "
+                                          "WHERE employee_id = ?", (self.bob,))
+        aggregates = self.db.execute_query("payroll",
+                                           "SELECT department, employee_count "
+                                           "FROM payroll_dept_aggregates")
+        self.assertEqual(aggregates, [('Sales', 1)])
+
+    def test_salary_statistics(self):
+        stats = self.salary_manager.get_salary_statistics()
+
+        self.assertEqual(stats['total_employees'], 3)
+        self.assertEqual((stats['min_base_salary'], stats['max_base_salary']),
+                         (4000.0, 6000.0))
+        self.assertEqual(stats['avg_base_salary'], 5000.0)
+        self.assertEqual(stats['total_payroll'], 15300.0)
+
+    def test_payslip(self):
+        payslip = self.salary_manager.generate_payslip(self.carol, '2024-01')
+
+        self.assertEqual(payslip['last_name'], 'Clark')
+        self.assertEqual(payslip['net_salary'], 5200.0)
+        self.assertIsNone(self.salary_manager.generate_payslip(self.carol, '2023-12'))
+
+
+class TestProcessPayroll(SalaryManagerTestCase):
+    def test_latest_salary_of_active_employees(self):
+        alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        bob = self.add_employee('Bob', 'Brown', 'Engineering', status='inactive')
+        self.add_employee('Carol', 'Clark', 'Sales')
+        self.set_salary(alice, 5000.0, effective_date='2023-06-01')
+        self.set_salary(alice, 5500.0, 100.0, 50.0, effective_date='2024-01-01')
+        self.set_salary(bob, 4000.0)
+
+        self.assertEqual(self.salary_manager.process_payroll('2024-03'), 1)
+
+        report = self.salary_manager.get_monthly_payroll_report('2024-03')
+        self.assertEqual([(r['employee_id'], r['base_salary'], r['net_salary'])
+                          for r in report],
+                         [(alice, 5500.0, 5550.0)])
+
+    def test_nothing_to_process(self):
+        self.assertEqual(self.salary_manager.process_payroll('2024-03'), 0)
+
+
+class TestAsOfSalary(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.set_salary(self.alice, 5000.0, effective_date='2023-01-01')
+        self.set_salary(self.alice, 5500.0, effective_date='2023-07-15')
+        self.set_salary(self.alice, 9999.0, effective_date='2999-01-01')
+
+    def test_salary_index_bisects_effective_dates(self):
+        index = self.salary_manager.build_salary_index()
+
+        self.assertIsNone(index.as_of(self.alice, '2022-12-31'))
+        self.assertEqual(index.as_of(self.alice, '2023-07-14').base_salary, 5000.0)
+        self.assertEqual(index.as_of(self.alice, '2023-07-15').base_salary, 5500.0)
+        self.assertIsNone(index.as_of('EMP-MISSING', '2024-01-01'))
+        salary = self.salary_manager.get_salary_as_of(self.alice, '2023-07-14')
+        self.assertEqual(salary['base_salary'], 5000.0)
+
+    def test_current_salary_ignores_future_raises(self):
+        salary = self.salary_manager.get_current_salary(self.alice)
+        self.assertEqual(salary['base_salary'], 5500.0)
+
+    def test_pay_runs_use_salary_effective_in_period(self):
+        for period, vectorized in (('2023-06', False), ('2023-07', False),
+                                   ('2023-06', True), ('2023-07', True)):
+            self.salary_manager.run_payroll(period, vectorized=vectorized)
+            payslip = self.salary_manager.generate_payslip(self.alice, period)
+            self.assertEqual(payslip['base_salary'],
+                             5000.0 if period == '2023-06' else 5500.0)
+        self.assertEqual(self.salary_manager.process_payroll('2022-12'), 0)
+
+
+class TestPayrollPreview(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.bob = self.add_employee('Bob', 'Brown', 'Engineering')
+        self.carol = self.add_employee('Carol', 'Clark', 'Sales')
+        self.set_salary(self.alice, 6000.0, 500.0, 300.0)
+        self.set_salary(self.bob, 4000.0, 0.0, 100.0)
+        self.set_salary(self.carol, 5000.0, 200.0, 0.0)
+
+    def test_preview_streams_rows_and_totals_without_writing(self):
+        items = list(self.salary_manager.preview_payroll('2024-01'))
+
+        rows, summary = items[:-1], items[-1]
+        self.assertEqual([r['employee_id'] for r in rows],
+                         sorted([self.alice, self.bob, self.carol]))
+        self.assertEqual(rows[-1]['running_total_net_salary'], 6200.0 + 3900.0 + 5200.0)
+        self.assertEqual(summary['employee_count'], 3)
+        self.assertEqual([(d['department'], d['employee_count'], d['total_net_salary'])
+                          for d in summary['departments']],
+                         [('Engineering', 2, 10100.0), ('Sales', 1, 5200.0)])
+        self.assertEqual(self.db.execute_single(
+            "payroll", "SELECT COUNT(*) FROM payroll_records")[0], 0)
+
+        self.salary_manager.process_payroll('2024-01')
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual([(r['employee_id'], r['net_salary']) for r in report],
+                         [(r['employee_id'], r['net_salary']) for r in rows])
+
+    def test_preview_api_streams_ndjson(self):
+        with self.api_client() as client:
+            res = client.get('/api/payroll/preview?period=2024-01')
+            lines = [json.loads(line)
+                     for line in res.get_data(as_text=True).splitlines()]
+            res_invalid = client.get('/api/payroll/preview?period=January')
+            self.assertEqual(res_invalid.status_code, 400)
+
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual([line['type'] for line in lines],
+                         ['row', 'row', 'row', 'summary'])
+        self.assertEqual(lines[-1]['total_net_salary'], 15300.0)
+
+
+class TestPeriodDiff(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.bob = self.add_employee('Bob', 'Brown', 'Engineering')
+        self.carol = self.add_employee('Carol', 'Clark', 'Sales')
+        self.dan = self.add_employee('Dan', 'Dorsey', 'Sales')
+        for employee_id in (self.alice, self.bob, self.carol):
+            self.set_salary(employee_id, 5000.0)
+        self.salary_manager.process_payroll('2024-01')
+
+        self.set_salary(self.alice, 5500.0, effective_date='2024-02-01')
+        self.set_salary(self.bob, 5010.0, effective_date='2024-02-01')
+        self.set_salary(self.dan, 4000.0, effective_date='2024-02-01')
+        self.employee_manager.update_employee(self.carol, {'status': 'inactive'})
+        self.salary_manager.process_payroll('2024-02')
+
+    def test_diff_reports_hires_terminations_and_changes_above_threshold(self):
+        diff = self.salary_manager.compare_periods('2024-01', '2024-02',
+                                                   threshold=100.0)
+
+        self.assertEqual([(c.employee_id, c.change, c.net_delta)
+                          for c in diff['changes']],
+                         sorted([(self.alice, 'changed', 500.0),
+                                 (self.carol, 'removed', -5000.0),
+                                 (self.dan, 'added', 4000.0)]))
+        self.assertEqual((diff['added'], diff['removed'], diff['changed']), (1, 1, 1))
+        dan = next(c for c in diff['changes'] if c.employee_id == self.dan)
+        self.assertEqual((dan.first_name, dan.previous_net_salary,
+                          dan.current_net_salary), ('Dan', None, 4000.0))
+
+    def test_api(self):
+        with self.api_client() as client:
+            res = client.get('/api/payroll/diff?from=2024-01&to=2024-02&threshold=100')
+            self.assertEqual((res.get_json()['added'], res.get_json()['changed']),
+                             (1, 1))
+            for query in ('from=2024-01', 'from=2024-1&to=2024-02',
+                          'from=2024-01&to=February', 'from=2024-01&to=2024-13',
+                          'from=2024-01&to=2024-02&threshold=high'):
+                url = f"/api/payroll/diff?{query}"
+                self.assertEqual(client.get(url).status_code, 400)
+
+
+class TestBackfillPayroll(SalaryManagerTestCase):
+    def test_backfill_resolves_salary_per_month(self):
+        alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        bob = self.add_employee('Bob', 'Brown', 'Sales')
+        self.set_salary(alice, 5000.0, effective_date='2023-11-01')
+        self.set_salary(alice, 5500.0, effective_date='2024-01-15')
+        self.set_salary(bob, 4000.0, 100.0, 50.0, effective_date='2023-12-01')
+
+        counts = self.salary_manager.backfill_payroll('2023-11', '2024-02')
+
+        self.assertEqual(counts,
+                         {'2023-11': 1, '2023-12': 2, '2024-01': 2, '2024-02': 2})
+        rows = self.db.execute_query("payroll",
+                                     "SELECT period, employee_id, net_salary "
+                                     "FROM payroll_records WHERE employee_id = ? "
+                                     "ORDER BY period", (alice,))
+        self.assertEqual([(r[0], r[2]) for r in rows],
+                         [('2023-11', 5000.0), ('2023-12', 5000.0),
+                          ('2024-01', 5500.0), ('2024-02', 5500.0)])
+        payslip = self.salary_manager.generate_payslip(bob, '2023-12')
+        self.assertEqual(payslip['net_salary'], 4050.0)
+
+        self.employee_manager.update_employee(bob, {'status': 'inactive'})
+        # Bob's past records stay: being inactive today does not undo them.
+        self.assertEqual(self.salary_manager.backfill_payroll('2023-11', '2024-02'),
+                         counts)
+        self.assertEqual(self.db.execute_single(
+            "payroll", "SELECT COUNT(*) FROM payroll_records")[0], 7)
+
+    def test_backfill_takes_the_write_lock_before_reading(self):
+        alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.set_salary(alice, 5000.0, effective_date='2023-11-01')
+        counts = self.salary_manager.backfill_payroll('2023-11', '2024-02')
+
+        # Another connection commits before every statement of the next
+        # backfill; once the backfill holds the write lock those commits fail.
+        payroll_db = os.path.join(self.db_dir, 'payroll.db')
+        timed = Database._timed
+
+        def commit_elsewhere(db, conn, db_name, handler, query, params):
+            other = sqlite3.connect(payroll_db, timeout=0)
+            try:
+                other.execute("UPDATE payroll_periods "
+                              "SET employee_count = employee_count")
+                other.commit()
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                other.close()
+            return timed(db, conn, db_name, handler, query, params)
+
+        with mock.patch.object(Database, '_timed', commit_elsewhere):
+            self.assertEqual(
+                self.salary_manager.backfill_payroll('2023-11', '2024-02'), counts)
+
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            self.salary_manager.backfill_payroll('2024-03', '2024-01')
+
+
+class TestPayrollTrend(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.bob = self.add_employee('Bob', 'Brown', 'Engineering')
+        self.carol = self.add_employee('Carol', 'Clark', 'Sales')
+        self.set_salary(self.alice, 6000.0, effective_date='2023-11-01')
+        self.set_salary(self.bob, 4000.0, effective_date='2023-11-01')
+        self.set_salary(self.carol, 5000.0, effective_date='2024-01-01')
+        self.salary_manager.backfill_payroll('2023-11', '2024-02')
+
+    def test_trend_per_period_and_department(self):
+        trend = self.salary_manager.get_payroll_trend('2023-01', '2024-01')
+        self.assertEqual([(t['period'], t['headcount'], t['total_net_salary'])
+                          for t in trend],
+                         [('2023-11', 2, 10000.0), ('2023-12', 2, 10000.0),
+                          ('2024-01', 3, 15000.0)])
+        self.assertEqual((trend[2]['min_net_salary'], trend[2]['max_net_salary'],
+                          trend[2]['avg_net_salary']),
+                         (4000.0, 6000.0, 5000.0))
+
+        sales = self.salary_manager.get_payroll_trend('2023-11', '2024-02',
+                                                      department='Sales')
+        self.assertEqual([(t['period'], t['headcount']) for t in sales],
+                         [('2024-01', 1), ('2024-02', 1)])
+        with self.assertRaises(ValueError):
+            self.salary_manager.get_payroll_trend('2024-02', '2024-01')
+
+    def test_min_and_max_survive_removing_the_extreme(self):
+        where = " WHERE employee_id = ? AND period = ?"
+        self.db.execute_update("payroll", "DELETE FROM payroll_records" + where,
+                               (self.alice, '2024-02'))
+        self.db.execute_update("payroll",
+                               "UPDATE payroll_records SET net_salary = 3000.0" + where,
+                               (self.bob, '2024-02'))
+        self.db.execute_update("payroll",
+                               "UPDATE payroll_records SET status = 'void'" + where,
+                               (self.bob, '2024-01'))
+
+        trend = {t['period']: t for t in self.salary_manager.get_payroll_trend(
+            '2024-01', '2024-02', 'Engineering')}
+        january, february = trend['2024-01'], trend['2024-02']
+        self.assertEqual((january['headcount'], january['min_net_salary']), (1, 6000.0))
+        self.assertEqual((february['min_net_salary'], february['max_net_salary']),
+                         (3000.0, 3000.0))
+
+    def test_api(self):
+        with self.api_client() as client:
+            res = client.get('/api/analytics/trend?from=2023-12&to=2024-02'
+                             '&department=Engineering')
+            self.assertEqual([t['total_net_salary'] for t in res.get_json()['periods']],
+                             [10000.0] * 3)
+            for url in ('/api/analytics/trend?from=2023-12',
+                        '/api/analytics/trend?from=bad&to=2024-01'):
+                self.assertEqual(client.get(url).status_code, 400)
+
+
+class TestSalaryDistribution(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engineers = [self.add_employee(f"Eng{i}", 'Anders', 'Engineering')
+                          for i in range(4)]
+        self.seller = self.add_employee('Carol', 'Clark', 'Sales')
+        for i, employee_id in enumerate(self.engineers):
+            self.set_salary(employee_id, 4000.0 + 1000.0 * i)
+        self.set_salary(self.seller, 3000.0)
+        self.salary_manager.backfill_payroll('2024-01', '2024-03')
+
+    def stored_periods(self):
+        return self.db.execute_query("payroll", "SELECT period, row_count "
+                                                "FROM payroll_distribution_periods "
+                                                "ORDER BY period")
+
+    def test_quantiles_and_histogram_merge_across_periods(self):
+        distribution = self.salary_manager.get_salary_distribution(
+            '2024-01', '2024-03', quantiles=(0, 0.5, 1))
+
+        self.assertEqual(distribution['count'], 15)
+        self.assertEqual(distribution['quantiles'],
+                         {'p0': 3000.0, 'p50': 5000.0, 'p100': 7000.0})
+        self.assertEqual([(b['lower'], b['count']) for b in distribution['histogram']],
+                         [(3000.0, 3), (4000.0, 3), (5000.0, 3), (6000.0, 3),
+                          (7000.0, 3)])
+        self.assertEqual(self.stored_periods(),
+                         [('2024-01', 5), ('2024-02', 5), ('2024-03', 5)])
+
+        engineering = self.salary_manager.get_salary_distribution(
+            '2024-02', '2024-02', department='Engineering')
+        self.assertEqual((engineering['count'], engineering['min'],
+                          engineering['quantiles']['p50']),
+                         (4, 4000.0, 5000.0))
+        with self.assertRaises(ValueError):
+            self.salary_manager.get_salary_distribution('2024-01', '2024-03',
+                                                        metric='allowances')
+
+    def test_pay_runs_store_the_period_sketches(self):
+        self.assertEqual(self.stored_periods(),
+                         [('2024-01', 5), ('2024-02', 5), ('2024-03', 5)])
+        self.salary_manager.process_payroll('2024-04')
+        self.assertEqual(self.stored_periods()[-1], ('2024-04', 5))
+
+    def test_only_changed_periods_are_rebuilt(self):
+        refresh = self.salary_manager.refresh_salary_distributions
+        self.assertEqual(refresh('2024-01', '2024-03'), {})
+
+        self.db.execute_update("payroll",
+                               "UPDATE payroll_records SET net_salary = 9000.0 "
+                               "WHERE employee_id = ? AND period = '2024-02'",
+                               (self.seller,))
+        self.db.execute_update("payroll",
+                               "DELETE FROM payroll_records WHERE period = '2024-03'")
+        self.assertEqual(sorted(refresh('2024-01', '2024-03')), ['2024-02', '2024-03'])
+        self.assertEqual(self.stored_periods(), [('2024-01', 5), ('2024-02', 5)])
+        distribution = self.salary_manager.get_salary_distribution('2024-02', '2024-03')
+        self.assertEqual(distribution['max'], 9000.0)
+
+    def test_read_only_database_builds_in_memory(self):
+        self.db.execute_update("payroll",
+                               "DELETE FROM payroll_records "
+                               "WHERE employee_id = ? AND period = '2024-01'",
+                               (self.seller,))
+        read_only = SalaryManager(Database(self.db_dir, read_only=True))
+        distribution = read_only.get_salary_distribution('2024-01', '2024-01')
+        self.assertEqual((distribution['count'], distribution['min']), (4, 4000.0))
+        self.assertEqual(self.stored_periods()[0], ('2024-01', 5))
+
+    def test_api(self):
+        with self.api_client() as client:
+            res = client.get('/api/analytics/distribution?from=2024-01&to=2024-03'
+                             '&department=Sales&metric=base_salary&quantiles=0.5,0.9')
+            self.assertEqual(res.get_json()['quantiles'],
+                             {'p50': 3000.0, 'p90': 3000.0})
+            for query in ('from=2024-01&to=2024-03&quantiles=2', 'from=2024-01'):
+                url = f"/api/analytics/distribution?{query}"
+                self.assertEqual(client.get(url).status_code, 400)
+
+
+class TestIdempotentPayroll(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        # Inactive employees are only dropped from the current period.
+        self.period = datetime.now().strftime('%Y-%m')
+        self.alice = self.add_employee('Alice', 'Anders', 'Engineering')
+        self.bob = self.add_employee('Bob', 'Brown', 'Engineering')
+        self.set_salary(self.alice, 5000.0)
+        self.set_salary(self.bob, 4000.0)
+        self.assertEqual(self.salary_manager.process_payroll(self.period), 2)
+
+    def backdate_last_run(self):
+        # Timestamps have one-second resolution; move the last run into the past
+        # so only changes made after it count as new.
+        self.db.execute_update("payroll", "UPDATE payroll_periods "
+                                          "SET processed_at = '2000-01-01 00:00:00'")
+        for db_name, table in (("employees", "employees"), ("salary", "salaries")):
+            self.db.execute_update(db_name, f"UPDATE {table} "
+                                            "SET created_at = '1999-01-01 00:00:00', "
+                                            "updated_at = '1999-01-01 00:00:00'")
+
+    def period_rows(self):
+        return self.db.execute_query("payroll", "SELECT employee_id, net_salary "
+                                                "FROM payroll_records WHERE period = ? "
+                                                "ORDER BY employee_id", (self.period,))
+
+    def test_rerun_does_not_duplicate(self):
+        self.assertEqual(self.salary_manager.process_payroll(self.period), 2)
+        self.assertEqual(len(self.period_rows()), 2)
+        self.assertEqual(
+            self.salary_manager.get_salary_statistics()['total_payroll'], 9000.0)
+
+    def test_full_rerun_removes_ineligible_employees(self):
+        self.employee_manager.update_employee(self.bob, {'status': 'inactive'})
+        self.assertEqual(self.salary_manager.process_payroll(self.period), 1)
+        self.assertEqual(self.period_rows(), [(self.alice, 5000.0)])
+
+    def test_rerun_of_past_period_keeps_history(self):
+        self.assertEqual(self.salary_manager.process_payroll('2024-03'), 2)
+        self.employee_manager.update_employee(self.bob, {'status': 'inactive'})
+        self.assertEqual(self.salary_manager.process_payroll('2024-03'), 2)
+        self.assertEqual(self.salary_manager.backfill_payroll('2024-03', '2024-03'),
+                         {'2024-03': 2})
+
+        bob_salary = self.salary_manager.get_salary_history(self.bob)[0]
+        self.salary_manager.delete_salary(bob_salary['id'])
+        self.assertEqual(self.salary_manager.process_payroll('2024-03'), 1)
+
+    def test_incremental_rerun_touches_only_changed_employees(self):
+        self.backdate_last_run()
+        self.assertEqual(
+            self.salary_manager.process_payroll(self.period, incremental=True), 0)
+
+        self.set_salary(self.alice, 5200.0, effective_date='2024-02-01')
+        self.assertEqual(
+            self.salary_manager.process_payroll(self.period, incremental=True), 1)
+        self.assertEqual(dict(self.period_rows())[self.alice], 5200.0)
+
+        self.backdate_last_run()
+        self.employee_manager.update_employee(self.bob, {'status': 'inactive'})
+        self.assertEqual(
+            self.salary_manager.process_payroll(self.period, incremental=True), 1)
+        self.assertEqual(self.period_rows(), [(self.alice, 5200.0)])
+
+    def test_incremental_rerun_drops_deleted_employees(self):
+        self.backdate_last_run()
+        self.employee_manager.delete_employee(self.bob)
+
+        self.assertEqual(
+            self.salary_manager.process_payroll(self.period, incremental=True), 1)
+        self.assertEqual(self.period_rows(), [(self.alice, 5000.0)])
+        self.assertEqual(
+            self.salary_manager.get_salary_statistics()['total_payroll'], 5000.0)
+        departments = self.salary_manager.get_department_salary_stats()
+        self.assertEqual([s['employee_count'] for s in departments], [1])
+
+    def test_chunked_run_matches_single_run(self):
+        carol = self.add_employee('Carol', 'Clark', 'Sales')
+        self.add_employee('Dan', 'Dorsey', 'Sales')
+        self.set_salary(carol, 3000.0)
+        self.employee_manager.update_employee(self.bob, {'status': 'inactive'})
+
+        calls = []
+        result = self.salary_manager.run_payroll(self.period, chunk_size=1,
+            progress=lambda done, total: calls.append((done, total)))
+
+        self.assertEqual(result, 2)
+        self.assertEqual(self.period_rows(),
+                         sorted([(self.alice, 5000.0), (carol, 3000.0)]))
+        self.assertEqual(calls[0], (0, 2))
+        self.assertEqual(calls[-1], (2, 2))
+        self.assertGreater(len(calls), 3)
+
+    def test_incremental_without_previous_run_is_a_full_run(self):
+        self.assertEqual(
+            self.salary_manager.process_payroll('2024-04', incremental=True), 2)
+
+
+class TestResumablePayroll(SalaryManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee_ids = [self.add_employee(f"First{i}", f"Last{i}", 'Ops')
+                             for i in range(6)]
+        for i, employee_id in enumerate(self.employee_ids):
+            self.set_salary(employee_id, 1000.0 + i)
+
+    def interrupt_after(self, chunks):
+        calls = []
+
+        def progress(processed, total):
+            calls.append(processed)
+            if len(calls) > chunks:
+                raise RuntimeError('worker killed')
+        return progress
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        with self.assertRaises(RuntimeError):
+            self.salary_manager.run_payroll('2024-01', chunk_size=2,
+                                            progress=self.interrupt_after(2))
+
+        self.assertEqual(self.salary_manager.get_monthly_payroll_report('2024-01'), [])
+        run = self.salary_manager.get_payroll_runs('2024-01')[0]
+        self.assertEqual((run['status'], run['processed']), ('running', 4))
+        self.assertEqual(run['last_employee_id'], sorted(self.employee_ids)[3])
+
+        calls = []
+        result = self.salary_manager.run_payroll(
+            '2024-01', chunk_size=2, progress=lambda done, total: calls.append(done))
+        self.assertEqual(result, 6)
+        self.assertEqual(calls[0], 4)
+        self.assertEqual(calls[-1], 6)
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual(len(report), 6)
+        runs = self.salary_manager.get_payroll_runs('2024-01')
+        self.assertEqual([r['status'] for r in runs], ['completed'])
+        staged = self.db.execute_single("payroll",
+                                        "SELECT COUNT(*) FROM payroll_staging")
+        self.assertEqual(staged[0], 0)
+
+    def test_run_interrupted_before_completion_is_finished(self):
+        with mock.patch.object(SalaryManager, '_complete_run',
+                               side_effect=RuntimeError('timeout')):
+            with self.assertRaises(RuntimeError):
+                self.salary_manager.run_payroll('2024-01', chunk_size=4)
+
+        run = self.salary_manager.get_payroll_runs('2024-01')[0]
+        self.assertEqual(run['status'], 'staged')
+        self.assertEqual(self.salary_manager.run_payroll('2024-01', chunk_size=4), 6)
+
+    def test_restart_without_resume_abandons_the_run(self):
+        with self.assertRaises(RuntimeError):
+            self.salary_manager.run_payroll('2024-01', chunk_size=2,
+                                            progress=self.interrupt_after(1))
+
+        self.assertEqual(self.salary_manager.run_payroll('2024-01', resume=False), 6)
+        runs = self.salary_manager.get_payroll_runs('2024-01')
+        self.assertEqual([r['status'] for r in runs], ['abandoned', 'completed'])
+
+    def test_superseded_run_stops_writing(self):
+        def restart(processed, total):
+            if processed == 2:
+                other = SalaryManager(self.db)
+                self.assertEqual(
+                    other.run_payroll('2024-01', chunk_size=2, resume=False), 6)
+
+        with self.assertRaises(PayrollRunSuperseded):
+            self.salary_manager.run_payroll('2024-01', chunk_size=2, progress=restart)
+
+        report = self.salary_manager.get_monthly_payroll_report('2024-01')
+        self.assertEqual(len(report), 6)
+        runs = self.salary_manager.get_payroll_runs('2024-01')
+        self.assertEqual([r['status'] for r in runs], ['abandoned', 'completed'])
+        staged = self.db.execute_single("payroll",
+                                        "SELECT COUNT(*) FROM payroll_staging")
+        self.assertEqual(staged[0], 0)
+
+
+class TestParallelPayroll(SalaryManagerTestCase):
+    def test_parallel_engine_matches_serial_run(self):
+        employee_ids = [self.add_employee(f"First{i}", f"Last{i}", 'Ops')
+                        for i in range(12)]
+        for i, employee_id in enumerate(employee_ids):
+            self.set_salary(employee_id, 1000.0 + i, 10.0, 5.0)
+        self.employee_manager.update_employee(employee_ids[0], {'status': 'inactive'})
+
+        self.assertEqual(self.salary_manager.process_payroll('2024-01', workers=1), 11)
+        query = ("SELECT employee_id, base_salary, net_salary "
+                 "FROM payroll_records WHERE period = ? ORDER BY 1")
+        serial = self.db.execute_query("payroll", query, ('2024-01',))
+
+        self.assertEqual(self.salary_manager.run_payroll('2024-02', workers=2), 11)
+        parallel = self.db.execute_query("payroll", query, ('2024-02',))
+        self.assertEqual(parallel, serial)
+
+
+class TestVectorizedPayroll(SalaryManagerTestCase):
+    def test_vectorized_engine_matches_serial_run(self):
+        employee_ids = [self.add_employee(f"First{i}", f"Last{i}", 'Ops')
+                        for i in range(5)]
+        for i, employee_id in enumerate(employee_ids):
+            self.set_salary(employee_id, 1000.1 + i, 0.2, 0.05)
+        # Half a cent: both engines round it away from zero.
+        self.set_salary(employee_ids[0], 1000.1, 0.2, 0.125,
+                        effective_date='2024-01-15')
+
+        run_payroll = self.salary_manager.run_payroll
+        self.assertEqual(run_payroll('2024-01', vectorized=False), 5)
+        self.assertEqual(run_payroll('2024-02', vectorized=True), 5)
+        query = ("SELECT employee_id, net_salary FROM payroll_records "
+                 "WHERE period = ? ORDER BY 1")
+        serial = self.db.execute_query("payroll", query, ('2024-01',))
+        vectorized = self.db.execute_query("payroll", query, ('2024-02',))
+        self.assertEqual(vectorized, serial)
+        expected = {employee_id: 1000.25 + i
+                    for i, employee_id in enumerate(employee_ids)}
+        expected[employee_ids[0]] = 1000.17
+        self.assertEqual(dict(vectorized), expected)
+
+    def test_pure_python_fallback(self):
+        rows = [('E1', 0.1, 0.2, 0.0), ('E2', 5000.0, None, 12.34)]
+        with mock.patch.object(payroll_engine, 'np', None):
+            fallback = payroll_engine.compute_payroll_rows(rows)
+
+        self.assertEqual(fallback, [('E1', 0.1, 0.2, 0.0, 0.3),
+                                    ('E2', 5000.0, None, 12.34, 4987.66)])
+        self.assertEqual(payroll_engine.compute_payroll_rows(rows), fallback)
+
+
+class TestBulkWrites(SalaryManagerTestCase):
+    def test_bulk_load_and_pay_run(self):
+        employees = [{
+            'first_name': f"First{i}",
+            'last_name': f"Last{i}",
+            'email': f"employee{i}@example.com",
+            'phone': '',
+            'department': 'Operations',
+            'position': 'Staff',
+            'hire_date': '2023-01-01',
+            'status': 'active'
+        } for i in range(200)]
+        self.assertEqual(self.employee_manager.add_employees(employees), 200)
+
+        salaries = [{
+            'employee_id': e['employee_id'],
+            'base_salary': 3000.0,
+            'allowances': 100.0,
+            'deductions': 50.0,
+            'effective_date': '2024-01-01'
+        } for e in self.employee_manager.get_all_employees()]
+        self.assertEqual(self.salary_manager.set_salaries(salaries), 200)
+
+        self.assertEqual(self.salary_manager.process_payroll('2024-02'), 200)
+        stats = self.salary_manager.get_salary_statistics()
+        self.assertEqual(stats['total_payroll'], 200 * 3050.0)
+
+    def test_failed_bulk_load_writes_nothing(self):
+        employee = {
+            'first_name': 'Dup',
+            'last_name': 'Licate',
+            'email': 'dup@example.com',
+            'phone': '',
+            'department': 'Operations',
+            'position': 'Staff',
+            'hire_date': '2023-01-01',
+            'status': 'active'
+        }
+        self.assertEqual(self.employee_manager.add_employees([employee, employee]), 0)
+        self.assertEqual(self.employee_manager.get_employee_count(), 0)
+
+        salary = {'employee_id': 'E001', 'base_salary': 3000.0, 'allowances': 0.0,
+                  'deductions': 0.0, 'effective_date': None}
+        self.assertEqual(self.salary_manager.set_salaries([salary]), 0)
+
+    def test_other_bulk_load_errors_propagate(self):
+        salary = {'employee_id': 'E001', 'base_salary': 3000.0, 'allowances': 0.0,
+                  'deductions': 0.0, 'effective_date': '2024-01-01'}
+        with mock.patch.object(Database, 'execute_many',
+                               side_effect=sqlite3.OperationalError('disk I/O error')):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.salary_manager.set_salaries([salary])
+            with self.assertRaises(sqlite3.OperationalError):
+                self.employee_manager.add_employees([])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import unittest
+from unittest import mock
+
+from employee_manager import EmployeeManager
+from salary_manager import SalaryManager
+from tests.base import DatabaseTestCase
+
+
+class TestStreamingResponses(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        employees = [{
+            'first_name': f"First{i}",
+            'last_name': f"Last{i:02d}",
+            'email': f"employee{i}@example.com",
+            'phone': '',
+            'department': 'Operations',
+            'position': 'Staff',
+            'hire_date': '2023-01-01',
+            'status': 'active'
+        } for i in range(30)]
+        EmployeeManager(self.db).add_employees(employees)
+        salary_manager = SalaryManager(self.db)
+        employee_ids = [e['employee_id']
+                        for e in EmployeeManager(self.db).get_all_employees()]
+        salary_manager.set_salaries([{'employee_id': employee_id, 'base_salary': 1000.0,
+                                      'allowances': 0.0, 'deductions': 0.0,
+                                      'effective_date': '2024-01-01'}
+                                     for employee_id in employee_ids])
+        salary_manager.process_payroll('2024-01')
+
+        self.client = self.enterContext(self.api_client())
+        self.enterContext(mock.patch('main.STREAM_CHUNK_SIZE', 512))
+
+    def test_report_as_ndjson(self):
+        res = self.client.get('/api/payroll/report?period=2024-01',
+                              headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(res.is_streamed)
+        rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(rows), 30)
+        buffered = self.client.get('/api/payroll/report?period=2024-01').get_json()
+        self.assertEqual(rows, buffered['records'])
+
+    def test_chunked_json_matches_buffered_response(self):
+        for url in ('/api/payroll/report?period=2024-01', '/api/employees',
+                    '/api/employees?q=First1'):
+            separator = '&' if '?' in url else '?'
+            streamed = self.client.get(f"{url}{separator}format=json-stream")
+            self.assertTrue(streamed.is_streamed)
+            self.assertEqual(json.loads(streamed.get_data(as_text=True)),
+                             self.client.get(url).get_json())
+
+    def test_empty_stream(self):
+        res = self.client.get('/api/payroll/report?period=1999-01&format=json-stream')
+        self.assertEqual(json.loads(res.get_data(as_text=True)),
+                         {'period': '1999-01', 'records': []})
+
+
+if __name__ == '__main__':
+    unittest.main()